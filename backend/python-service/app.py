@@ -3,8 +3,8 @@ from flask_cors import CORS
 import pandas as pd
 import numpy as np
 from pickle import load
-from scipy.optimize import minimize
 import math
+import threading
 from blueprints.signup import signup_bp
 from blueprints.marketoverview import marketoverview_bp
 from blueprints.singlestock import singlestock_bp
@@ -12,7 +12,11 @@ from blueprints.News import news_bp
 from blueprints.Chat import chat_bp
 from blueprints.watchlist import watchlist_bp
 from blueprints.planner import planner_bp
-from blueprints.simulator import simulator_bp
+from blueprints.simulator import simulator_bp, simulation_cache
+from blueprints import market_data, simulation_engine
+from blueprints.backtest_engine import build_weight_matrix, run_backtest, compute_backtest_metrics
+from blueprints.result_cache import LRUCache, canonical_order, restore_order
+from blueprints.portfolio_optimizer import min_variance_weights, critical_line, interpolate_frontier, max_sharpe_on_frontier
 app = Flask(__name__)
 CORS(app)
 
@@ -27,85 +31,78 @@ app.register_blueprint(planner_bp, url_prefix='/api')
 app.register_blueprint(simulator_bp, url_prefix='/api')
 
 def load_assets_from_csv():
-    df_wide = pd.read_csv('backend/python-service/stock_data_with_sector.csv')
-    industry_row = df_wide.iloc[0]
-    ticker_row = df_wide.iloc[1]
-    
-    data_part = df_wide.iloc[3:].copy()
-    data_part.rename(columns={'Price': 'Date'}, inplace=True)
-    data_part['Date'] = pd.to_datetime(data_part['Date'], errors='coerce')
-    
-    long_df = pd.melt(data_part, id_vars='Date', var_name='ColName', value_name='Value')
-    ticker_map = dict(zip(ticker_row.index, ticker_row.values))
-    industry_map = dict(zip(industry_row.index, industry_row.values))
-    
-    long_df['Ticker'] = long_df['ColName'].map(ticker_map)
-    long_df['Industry'] = long_df['ColName'].map(industry_map)
-    long_df.dropna(subset=['Value'], inplace=True)
-    long_df.reset_index(drop=True, inplace=True)
-    
-    def get_attribute(col_name):
-        for attr in ['Close', 'Low', 'Open', 'Volume']:
-            if col_name.startswith(attr):
-                return attr
-        return None
-    long_df['Attribute'] = long_df['ColName'].apply(get_attribute)
-    
-    df_long = long_df.pivot_table(
-        index=['Date', 'Ticker', 'Industry'],
-        columns='Attribute',
-        values='Value',
-        aggfunc='first'
-    ).reset_index()
-    df_long.columns.name = None
-    df_long.sort_values(by=['Ticker', 'Date'], inplace=True)
-    df_long.reset_index(drop=True, inplace=True)
-    
-    assets_raw = df_long[['Date', 'Ticker', 'Close']].copy()
-    assets_raw['Close'] = pd.to_numeric(assets_raw['Close'], errors='coerce')
-    assets_raw.dropna(subset=['Close'], inplace=True)
-    assets_raw = assets_raw.pivot(index='Date', columns='Ticker', values='Close')
-    assets_raw = assets_raw.ffill().bfill()
-    assets_monthly = assets_raw.resample('M').last()
-    return assets_monthly
+    # Served from the shared market data store (columnar snapshot of the CSV),
+    # the same data the simulator blueprint draws its historical returns from.
+    return market_data.get_store().assets_monthly
 
 assets_monthly = load_assets_from_csv()
 
-model = load(open('backend/python-service/model.pkl', 'rb'))
-
-def annualize_returns_and_cov(assets_df):
-    monthly_returns = assets_df.pct_change().dropna()
-    mu_monthly = monthly_returns.mean()
-    cov_monthly = monthly_returns.cov()
-    
-    mu_annual = mu_monthly * 12
-    cov_annual = cov_monthly * 12
-    return mu_annual, cov_annual
+def _on_market_data_reload(store):
+    global assets_monthly
+    assets_monthly = store.assets_monthly
+
+market_data.get_store().subscribe(_on_market_data_reload)
+
+# /allocate and /efficient_frontier responses keyed on the sorted ticker
+# tuple, request parameters and the market data version.
+analytics_cache = LRUCache(max_bytes=64 * 1024 * 1024, name='analytics')
+market_data.get_store().subscribe(lambda store: analytics_cache.clear())
+
+@app.before_request
+def refresh_market_data():
+    # Some routes read the assets_monthly global directly; touching the store
+    # here lets its throttled CSV check reload it for them too.
+    market_data.get_store()
+
+# The risk tolerance model is unpickled on first use rather than at import,
+# so process startup does not pay for loading scikit-learn.
+MODEL_PATH = 'backend/python-service/model.pkl'
+MAX_BATCH_ROWS = 100000
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                with open(MODEL_PATH, 'rb') as f:
+                    _model = load(f)
+    return _model
+
+def validate_feature_rows(rows, model):
+    # Feature matrix (rows x n_features) checked against the model schema.
+    try:
+        features = np.asarray(rows, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("'features' must be a list of equal-length numeric rows")
+    if features.ndim != 2 or features.shape[0] == 0:
+        raise ValueError("'features' must be a non-empty list of rows")
+    if features.shape[0] > MAX_BATCH_ROWS:
+        raise ValueError(f"At most {MAX_BATCH_ROWS} rows can be scored per request")
+    expected = getattr(model, 'n_features_in_', None)
+    if expected is not None and features.shape[1] != expected:
+        raise ValueError(f"Expected {expected} features per row, got {features.shape[1]}")
+    if not np.all(np.isfinite(features)):
+        raise ValueError("'features' must not contain NaN or infinite values")
+    return features
 
 def optimize_weights(expected_returns, cov_matrix, risk_tolerance):
     num_assets = len(expected_returns)
-    initial_weights = np.ones(num_assets) / num_assets
-
-    def portfolio_volatility(weights):
-        return np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
+    optimized_weights, info = min_variance_weights(np.asarray(cov_matrix))
+    if not info['converged']:
+        raise ValueError(f"Weight optimization failed: {info}")
     
-    constraints = {'type': 'eq', 'fun': lambda x: np.sum(x) - 1}
-    bounds = tuple((0, 1) for _ in range(num_assets))
-    
-    result = minimize(portfolio_volatility, initial_weights, method='SLSQP', bounds=bounds, constraints=constraints)
-    if not result.success:
-        raise ValueError("Weight optimization failed")
-    
-    optimized_weights = result.x
     adjusted_weights = (optimized_weights * risk_tolerance) + ((1 - risk_tolerance) / num_assets)
     final_weights = adjusted_weights / np.sum(adjusted_weights)
     return final_weights
 
 def get_asset_allocation(risk_tolerance, stock_tickers):
-    assets_selected = assets_monthly[stock_tickers].dropna(axis=0, how='any')
-    returns = assets_selected.pct_change().dropna()
-    
-    mu_annual, cov_annual = annualize_returns_and_cov(assets_selected)
+    # Returns and moments are sliced from the precomputed universe-wide
+    # matrices instead of being recomputed from the price frame.
+    store = market_data.get_store()
+    returns = store.monthly_returns[stock_tickers]
+    mu_annual, cov_annual = store.annualized_moments(stock_tickers)
     
     if len(stock_tickers) == 1:
         weights = [1.0]
@@ -193,65 +190,6 @@ def get_periods_per_year(freq):
     }
     return mapping.get(freq.lower(), 1)
 
-# simulate portfolio performance with periodic withdrawals
-def compute_performance_metrics_with_withdrawals(portfolio_returns, initial_capital, withdrawal_amount, rebalancing, risk_free_rate=0.04):
-    if rebalancing.lower() == "none":
-        period_length = None
-    else:
-        periods_per_year = get_periods_per_year(rebalancing)
-        period_length = int(12 / periods_per_year)
-    
-    balance_series = []
-    balance = initial_capital
-    for i, ret in enumerate(portfolio_returns):
-        balance *= (1 + ret)
-        # Apply withdrawal at the end of each period if applicable
-        if period_length and ((i + 1) % period_length == 0):
-            balance -= withdrawal_amount
-            if balance < 0:
-                balance = 0
-        balance_series.append(balance)
-    
-    df = pd.DataFrame({'balance': balance_series}, index=portfolio_returns.index)
-    final_balance = df['balance'].iloc[-1]
-    N = len(portfolio_returns)
-    years = N / 12.0
-    cagr = (final_balance / initial_capital) ** (1 / years) - 1 if years > 0 else 0
-    ann_stdev = np.std(portfolio_returns) * math.sqrt(12)
-    
-    # Maximum drawdown
-    df['peak'] = df['balance'].cummax()
-    df['drawdown'] = (df['balance'] - df['peak']) / df['peak']
-    max_drawdown = df['drawdown'].min()
-    
-    mean_monthly_excess = (portfolio_returns - (risk_free_rate / 12.0)).mean()
-    sharpe_ratio = 0.0
-    if np.std(portfolio_returns) > 1e-9:
-        sharpe_ratio = (mean_monthly_excess * 12.0) / (np.std(portfolio_returns) * math.sqrt(12))
-    
-    negative_returns = portfolio_returns[portfolio_returns < 0]
-    down_stdev = np.std(negative_returns) * math.sqrt(12) if len(negative_returns) > 0 else 0
-    sortino_ratio = 0.0
-    if down_stdev > 1e-9:
-        sortino_ratio = (mean_monthly_excess * 12.0) / down_stdev
-    
-    timeline_df = df.reset_index()
-    if timeline_df.columns[0] != 'date':
-        timeline_df.rename(columns={timeline_df.columns[0]: 'date'}, inplace=True)
-    if pd.api.types.is_datetime64_any_dtype(timeline_df['date']):
-        timeline_df['date'] = timeline_df['date'].dt.strftime('%Y-%m-%d')
-    timeline_df = timeline_df.sort_values(by='date').reset_index(drop=True)
-    
-    return {
-        'final_balance': final_balance,
-        'CAGR': cagr * 100,
-        'stdev': ann_stdev * 100,
-        'max_drawdown': max_drawdown * 100,
-        'sharpe_ratio': sharpe_ratio,
-        'sortino_ratio': sortino_ratio,
-        'timeline': timeline_df[['date', 'balance']].to_dict(orient='records')
-    }
-
 @app.route('/multi_portfolio_backtest', methods=['POST'])
 def multi_portfolio_backtest():
     try:
@@ -282,41 +220,54 @@ def multi_portfolio_backtest():
             benchmark_returns = benchmark_prices.pct_change().dropna()
             market_returns = benchmark_returns
         
+        # All portfolios are backtested together from one weight matrix over
+        # the union of their tickers. Holdings drift between rebalancing dates
+        # ('None' = buy and hold); withdrawals are taken at the same dates.
+        tickers, weights = build_weight_matrix(portfolios_config)
+        sub_df = df[tickers].dropna(how='any')
+        monthly_returns = sub_df.pct_change().dropna()
+        if monthly_returns.empty:
+            return jsonify({"error": "No data in the given date range"}), 400
+        
+        if rebalancing.lower() == "none":
+            period_length = None
+        else:
+            period_length = int(12 / get_periods_per_year(rebalancing))
+        
+        portfolio_returns, balances = run_backtest(
+            monthly_returns.values, weights, initial_capital, withdrawal_amount, period_length
+        )
+        aligned_market = None
+        if market_returns is not None:
+            aligned_market = market_returns.reindex(monthly_returns.index)
+            aligned_market = None if aligned_market.isna().any() else aligned_market.values
+        metrics = compute_backtest_metrics(
+            portfolio_returns, balances, initial_capital, aligned_market, risk_free_rate=0.04
+        )
+        
+        dates = monthly_returns.index.strftime('%Y-%m-%d').tolist()
         performance_summary = []
         growth_series = {}
-        
-        for i, pconfig in enumerate(portfolios_config, start=1):
-            weights_dict = pconfig.get("weights", {})
-            tickers = list(weights_dict.keys())
-            weights = list(weights_dict.values())
-            
-            sub_df = df[tickers].dropna(how='any')
-            monthly_returns = sub_df.pct_change().dropna()
-            w = np.array(weights)
-            portfolio_r = monthly_returns.dot(w)
-            
-            # Compute performance metrics with withdrawal effect
-            metrics = compute_performance_metrics_with_withdrawals(
-                portfolio_r,
-                initial_capital,
-                withdrawal_amount,
-                rebalancing,
-                risk_free_rate=0.04
-            )
-            
+        for p in range(len(portfolios_config)):
+            name = f"Portfolio {p + 1}"
+            correlation = None
+            if metrics['market_correlation'] is not None and np.isfinite(metrics['market_correlation'][p]):
+                correlation = round(float(metrics['market_correlation'][p]), 2)
             row = {
-                "Portfolio": f"Portfolio {i}",
+                "Portfolio": name,
                 "Initial Balance": initial_capital,
-                "Final Balance": round(metrics['final_balance'], 0),
-                "CAGR": round(metrics['CAGR'], 2),
-                "Stdev": round(metrics['stdev'], 2),
-                "Max Drawdown": round(metrics['max_drawdown'], 2),
-                "Sharpe Ratio": round(metrics['sharpe_ratio'], 2),
-                "Sortino Ratio": round(metrics['sortino_ratio'], 2),
-                "Market Correlation": 0  # Not computed here
+                "Final Balance": round(float(metrics['final_balance'][p]), 0),
+                "CAGR": round(float(metrics['CAGR'][p]), 2),
+                "Stdev": round(float(metrics['stdev'][p]), 2),
+                "Max Drawdown": round(float(metrics['max_drawdown'][p]), 2),
+                "Sharpe Ratio": round(float(metrics['sharpe_ratio'][p]), 2),
+                "Sortino Ratio": round(float(metrics['sortino_ratio'][p]), 2),
+                "Market Correlation": correlation
             }
             performance_summary.append(row)
-            growth_series[f"Portfolio {i}"] = metrics['timeline']
+            growth_series[name] = [
+                {'date': d, 'balance': b} for d, b in zip(dates, balances[:, p].tolist())
+            ]
         
         return jsonify({
             "performance_summary": performance_summary,
@@ -340,13 +291,31 @@ def predict_risk():
     try:
         data = request.json
         features_input = np.array(data['features']).reshape(1, -1)
-        prediction = model.predict(features_input)
+        prediction = get_model().predict(features_input)
         risk_tolerance = prediction[0]
         return jsonify({'risk_tolerance': risk_tolerance})
     except Exception as e:
         print('Error in /predict_risk:', e)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/predict_risk_batch', methods=['POST'])
+def predict_risk_batch():
+    # Scores many questionnaires in one vectorized model call.
+    try:
+        data = request.get_json()
+        if not data or 'features' not in data:
+            return jsonify({'error': "Missing 'features' matrix."}), 400
+        model = get_model()
+        try:
+            features_input = validate_feature_rows(data['features'], model)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        predictions = model.predict(features_input)
+        return jsonify({'risk_tolerance': np.asarray(predictions).tolist()})
+    except Exception as e:
+        print('Error in /predict_risk_batch:', e)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/allocate', methods=['POST'])
 def allocate_assets():
     try:
@@ -361,10 +330,21 @@ def allocate_assets():
         if missing:
             return jsonify({"error": f"Missing stock tickers: {missing}"}), 400
         
-        allocations, portfolio_perf = get_asset_allocation(risk_tolerance, stock_tickers)
+        # Results are computed and cached for the sorted ticker tuple, then
+        # mapped back to the order the caller asked for.
+        canonical, order = canonical_order(stock_tickers)
+        key = ('allocate', canonical, float(risk_tolerance), market_data.get_store().version)
+        cached = analytics_cache.get(key)
+        if cached is None:
+            allocations, portfolio_perf = get_asset_allocation(risk_tolerance, list(canonical))
+            cached = {
+                "allocations": list(allocations),
+                "portfolio_performance": portfolio_perf.to_dict(orient='records')
+            }
+            analytics_cache.put(key, cached)
         return jsonify({
-            "allocations": allocations,
-            "portfolio_performance": portfolio_perf.to_dict(orient='records')
+            "allocations": restore_order(cached["allocations"], order),
+            "portfolio_performance": cached["portfolio_performance"]
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -395,49 +375,42 @@ def get_performance():
         return jsonify({'error': str(e)}), 500
 
 def calculate_efficient_frontier(expected_returns, cov_matrix, num_points=50, risk_free_rate=0.04):
+    expected_returns = np.asarray(expected_returns, dtype=np.float64)
+    cov_matrix = np.asarray(cov_matrix, dtype=np.float64)
+
     def portfolio_performance(weights):
         ret = np.sum(expected_returns * weights)
         vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
         return vol, ret
 
-    num_assets = len(expected_returns)
-    bounds = tuple((0, 1) for _ in range(num_assets))
-    
-    def min_vol_objective(w):
-        return portfolio_performance(w)[0]
-    cons = {'type': 'eq', 'fun': lambda x: np.sum(x) - 1}
-    
-    res_min = minimize(min_vol_objective, np.ones(num_assets)/num_assets, method='SLSQP', bounds=bounds, constraints=cons)
-    if not res_min.success:
-        raise ValueError("Min-vol portfolio failed")
-    min_vol_weights = res_min.x
+    # Trace the whole frontier once with the critical line algorithm instead
+    # of solving one QP per point. The upper (efficient) branch runs from the
+    # max-return asset down to the min-vol portfolio; the lower branch is the
+    # efficient frontier of -returns, i.e. min-vol for targets below min_ret.
+    upper_branch = critical_line(expected_returns, cov_matrix)
+    lower_branch = critical_line(-expected_returns, cov_matrix)
+    min_vol_weights = upper_branch[-1]
     min_vol, min_ret = portfolio_performance(min_vol_weights)
     
     efficient_curve = []
     inefficient_curve = []
     returns_range = np.linspace(expected_returns.min(), expected_returns.max(), num_points)
-    for target_return in returns_range:
-        def objective(w):
-            return portfolio_performance(w)[0]
-        constraints = (
-            {'type': 'eq', 'fun': lambda x: np.sum(x) - 1},
-            {'type': 'eq', 'fun': lambda x: np.sum(expected_returns * x) - target_return}
-        )
-        res = minimize(objective, np.ones(num_assets)/num_assets, method='SLSQP', bounds=bounds, constraints=constraints)
-        if res.success:
-            vol, ret = portfolio_performance(res.x)
-            point = {'risk': round(vol, 4), 'return': round(ret, 4)}
-            if ret >= min_ret:
-                efficient_curve.append(point)
-            else:
-                inefficient_curve.append(point)
-    
-    def sharpe_ratio(w):
+    is_efficient = returns_range >= min_ret
+    frontier_weights = np.empty((num_points, len(expected_returns)))
+    frontier_weights[is_efficient] = interpolate_frontier(upper_branch, expected_returns, returns_range[is_efficient])
+    frontier_weights[~is_efficient] = interpolate_frontier(lower_branch, -expected_returns, -returns_range[~is_efficient])
+    for w in frontier_weights:
         vol, ret = portfolio_performance(w)
-        return -(ret - risk_free_rate) / vol
-    res_sharpe = minimize(sharpe_ratio, np.ones(num_assets)/num_assets, method='SLSQP', bounds=bounds, constraints=cons)
-    if res_sharpe.success:
-        tw = res_sharpe.x
+        point = {'risk': round(vol, 4), 'return': round(ret, 4)}
+        if ret >= min_ret:
+            efficient_curve.append(point)
+        else:
+            inefficient_curve.append(point)
+    
+    # Walk the frontier from max return through min-vol to min return.
+    frontier_path = np.vstack([upper_branch, lower_branch[::-1]])
+    tw = max_sharpe_on_frontier(frontier_path, expected_returns, cov_matrix, risk_free_rate)
+    if tw is not None:
         t_vol, t_ret = portfolio_performance(tw)
         tangent_portfolio = {'risk': round(t_vol, 4), 'return': round(t_ret, 4), 'weights': tw.tolist()}
     else:
@@ -473,13 +446,39 @@ def efficient_frontier():
         if not stock_tickers:
             return jsonify({"error": "No stock_tickers provided"}), 400
         
-        selected_df = assets_monthly[stock_tickers].dropna(axis=0, how='any')
-        mu_annual, cov_annual = annualize_returns_and_cov(selected_df)
+        canonical, order = canonical_order(stock_tickers)
+        store = market_data.get_store()
+        key = ('efficient_frontier', canonical, float(risk_free_rate), int(num_points), store.version)
+        ef_data = analytics_cache.get(key)
+        if ef_data is None:
+            mu_annual, cov_annual = store.annualized_moments(list(canonical))
+            ef_data = calculate_efficient_frontier(mu_annual.values, cov_annual.values, num_points, risk_free_rate)
+            analytics_cache.put(key, ef_data)
         
-        ef_data = calculate_efficient_frontier(mu_annual.values, cov_annual.values, num_points, risk_free_rate)
-        return jsonify(ef_data)
+        tangent = ef_data['tangent_portfolio']
+        if tangent is not None:
+            tangent = dict(tangent, weights=restore_order(tangent['weights'], order))
+        return jsonify(dict(ef_data, tangent_portfolio=tangent))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/market_data/reload', methods=['POST'])
+def reload_market_data():
+    # Re-reads the CSV now instead of waiting for the periodic check.
+    try:
+        store = market_data.get_store()
+        changed = store.reload()
+        return jsonify({'changed': changed, 'version': store.version})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'analytics': analytics_cache.stats(), 'simulator': simulation_cache.stats()})
+
+# Spawn the simulator's worker processes now rather than on the first
+# pooled request (only with SIMULATOR_WORKERS > 1 and SIMULATOR_WARM_POOL).
+simulation_engine.warm_pool()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5002)
\ No newline at end of file
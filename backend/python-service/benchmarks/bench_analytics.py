@@ -0,0 +1,171 @@
+"""Benchmarks for the portfolio analytics functions and endpoints.
+
+Generates a synthetic price CSV in the stock_data_with_sector.csv layout,
+points the market data store at it, then times each case and reports p50/p95
+latency and peak traced memory. Results can be saved as a baseline and later
+runs compared against it:
+
+    python backend/python-service/benchmarks/bench_analytics.py --save-baseline
+    python backend/python-service/benchmarks/bench_analytics.py --tickers 200 --years 40
+
+The exit status is 1 when any case's p50 regresses past --threshold.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# benchmarks/ for synthetic_data, python-service/ for app and blueprints
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+
+from synthetic_data import generate_wide_csv  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline_analytics.json')
+
+
+def measure(fn, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    # Memory is traced in a separate run so tracing overhead stays out of
+    # the latency numbers.
+    if setup:
+        setup()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings_ms = np.array(timings) * 1000
+    return {
+        'p50_ms': float(np.percentile(timings_ms, 50)),
+        'p95_ms': float(np.percentile(timings_ms, 95)),
+        'peak_kb': peak / 1024,
+    }
+
+
+def build_cases(app_module, market_data, csv_path, args):
+    store = market_data.get_store()
+    tickers = [t for t in store.assets_monthly.columns if t != '^GSPC']
+    subset = tickers[:args.portfolio_size]
+    client = app_module.app.test_client()
+    mu, cov = store.annualized_moments(subset)
+    returns = store.monthly_returns[subset].mean(axis=1)
+    rng = np.random.default_rng(0)
+
+    portfolios = []
+    for _ in range(args.portfolios):
+        picks = rng.choice(len(tickers), size=min(10, len(tickers)), replace=False)
+        weights = rng.dirichlet(np.ones(len(picks)))
+        portfolios.append({'weights': {tickers[i]: float(w) for i, w in zip(picks, weights)}})
+    first_year = int(store.assets_monthly.index[0].year)
+    last_year = int(store.assets_monthly.index[-1].year)
+    backtest_body = {
+        'start_year': first_year, 'end_year': last_year, 'initial_capital': 10000,
+        'rebalancing': 'Quarterly', 'withdrawal_amount': 100, 'portfolios': portfolios,
+    }
+
+    def post(path, body):
+        response = client.post(path, json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_json()}")
+
+    clear_cache = app_module.analytics_cache.clear
+    return [
+        ('compile_snapshot', lambda: market_data.compile_snapshot(csv_path), None),
+        ('load_assets_monthly', lambda: market_data.load_assets_monthly(csv_path), None),
+        ('store_reload', lambda: store.reload(force=True), None),
+        ('get_asset_allocation', lambda: app_module.get_asset_allocation(0.5, subset), None),
+        ('calculate_efficient_frontier',
+         lambda: app_module.calculate_efficient_frontier(mu.values, cov.values, args.num_points), None),
+        ('compute_performance_metrics', lambda: app_module.compute_performance_metrics(returns), None),
+        ('POST /allocate', lambda: post('/allocate', {'risk_tolerance': 0.5, 'stock_tickers': subset}), clear_cache),
+        ('POST /allocate (cached)', lambda: post('/allocate', {'risk_tolerance': 0.5, 'stock_tickers': subset}), None),
+        ('POST /efficient_frontier',
+         lambda: post('/efficient_frontier', {'stock_tickers': subset, 'num_points': args.num_points}), clear_cache),
+        ('POST /multi_portfolio_backtest', lambda: post('/multi_portfolio_backtest', backtest_body), None),
+    ]
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\n{'case':<36}{'p50 ms':>10}{'p95 ms':>10}{'peak KB':>12}{'vs base':>10}")
+    for name, result in results.items():
+        ratio = ''
+        base = baseline.get(name) if baseline else None
+        if base and base['p50_ms'] > 0:
+            r = result['p50_ms'] / base['p50_ms']
+            ratio = f"{r:.2f}x"
+            if r > threshold:
+                regressions.append((name, r))
+                ratio += ' !'
+        print(f"{name:<36}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['peak_kb']:>12.0f}{ratio:>10}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=100, help='number of tickers in the synthetic CSV')
+    parser.add_argument('--years', type=int, default=30, help='years of daily history')
+    parser.add_argument('--portfolio-size', type=int, default=30, help='tickers per allocation/frontier request')
+    parser.add_argument('--portfolios', type=int, default=20, help='portfolios per backtest request')
+    parser.add_argument('--num-points', type=int, default=100, help='efficient frontier points')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--cases', default='', help='comma-separated substrings selecting cases')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=1.25, help='p50 ratio counted as a regression')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-analytics-')
+    try:
+        csv_path = os.path.join(workdir, 'stock_data_with_sector.csv')
+        generate_wide_csv(csv_path, n_tickers=args.tickers, n_years=args.years)
+        # The store reads its CSV location when blueprints.market_data is imported.
+        os.environ['MARKET_DATA_CSV'] = csv_path
+        import app as app_module
+        from blueprints import market_data
+
+        cases = build_cases(app_module, market_data, csv_path, args)
+        selected = [c.strip() for c in args.cases.split(',') if c.strip()]
+        results = {}
+        for name, fn, setup in cases:
+            if selected and not any(s in name for s in selected):
+                continue
+            repeat = max(3, args.repeat // 5) if name == 'compile_snapshot' else args.repeat
+            results[name] = measure(fn, repeat, setup)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    config = {k: getattr(args, k) for k in ('tickers', 'years', 'portfolio_size', 'portfolios', 'num_points')}
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if stored.get('config') != config:
+            print(f"Baseline {args.baseline} was recorded with {stored.get('config')}, not comparing.")
+        else:
+            baseline = stored.get('results', {})
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+    if regressions:
+        print("\nRegressions: " + ', '.join(f"{name} ({r:.2f}x)" for name, r in regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
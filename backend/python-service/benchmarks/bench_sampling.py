@@ -0,0 +1,114 @@
+"""Error-vs-path-count curves of the simulator's sampling modes.
+
+For each sampling mode the final-balance p5, p50 and mean of one scenario
+are estimated at increasing path counts over many seeds, and the RMS
+relative error against a large plain Monte Carlo reference is reported.
+Fewer paths for the same error is the point of the non-random modes:
+
+    python backend/python-service/benchmarks/bench_sampling.py
+    python backend/python-service/benchmarks/bench_sampling.py --model garch --rebalancing quarterly
+    python backend/python-service/benchmarks/bench_sampling.py --paths 256,1024,4096 --seeds 50 --json out.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from blueprints import simulator  # noqa: E402
+
+MODES = [
+    ('random', {'sampling_mode': 'random'}),
+    ('antithetic', {'sampling_mode': 'antithetic'}),
+    ('sobol', {'sampling_mode': 'sobol'}),
+    ('random+mm', {'sampling_mode': 'random', 'moment_matching': True}),
+    ('antithetic+mm', {'sampling_mode': 'antithetic', 'moment_matching': True}),
+    ('sobol+mm', {'sampling_mode': 'sobol', 'moment_matching': True}),
+]
+STATISTICS = ('p5', 'p50', 'mean')
+
+
+def request_features(args):
+    features = {
+        'initial_amount': 10000,
+        'investment_years': args.years,
+        'rebalancing_frequency': args.rebalancing,
+        'assets': [
+            {'ticker': 'EQ', 'allocation': 60, 'mean_return': 0.08, 'volatility': 0.18},
+            {'ticker': 'BD', 'allocation': 40, 'mean_return': 0.04, 'volatility': 0.06},
+        ],
+    }
+    if args.model == 'parameterized':
+        features['simulation_model'] = 'parameterized'
+    else:
+        features['simulation_model'] = 'statistical'
+        features['time_series_model'] = args.model
+    return features
+
+
+def final_statistics(features, num_simulations, seed):
+    params = simulator.build_simulation_params(dict(features, num_simulations=num_simulations, random_seed=seed))
+    final = simulator.run_scenarios(params, [params])[0][0][:, -1]
+    return np.array([np.percentile(final, 5), np.median(final), final.mean()])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', choices=['normal', 'garch', 'parameterized'], default='normal')
+    parser.add_argument('--rebalancing', default='none', help='rebalancing_frequency of the request')
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--paths', default='250,500,1000,2000,4000', help='comma-separated path counts')
+    parser.add_argument('--seeds', type=int, default=40, help='independent runs per point')
+    parser.add_argument('--reference-paths', type=int, default=400000)
+    parser.add_argument('--modes', default='', help='comma-separated subset of ' + ','.join(m for m, _ in MODES))
+    parser.add_argument('--json', help='also write the curves to this file')
+    args = parser.parse_args()
+
+    features = request_features(args)
+    path_counts = [int(p) for p in args.paths.split(',') if p.strip()]
+    selected = {m.strip() for m in args.modes.split(',') if m.strip()}
+    modes = [(name, extra) for name, extra in MODES if not selected or name in selected]
+
+    start = time.perf_counter()
+    reference = final_statistics(features, args.reference_paths, seed=10 ** 6)
+    print(f"reference ({args.reference_paths} random paths, {time.perf_counter() - start:.1f}s): "
+          + ', '.join(f"{name}={value:,.0f}" for name, value in zip(STATISTICS, reference)))
+
+    curves = {}
+    print(f"\n{'mode':<16}{'paths':>8}" + ''.join(f"{'err ' + name:>12}" for name in STATISTICS) + f"{'ms/run':>10}")
+    for name, extra in modes:
+        curves[name] = []
+        for n in path_counts:
+            # Sobol rounds the path count to a power of two; report what ran.
+            n = simulator.build_simulation_params(dict(features, num_simulations=n, **extra))['num_simulations']
+            start = time.perf_counter()
+            estimates = np.array([final_statistics(dict(features, **extra), n, seed) for seed in range(args.seeds)])
+            elapsed_ms = (time.perf_counter() - start) * 1000 / args.seeds
+            errors = np.sqrt(((estimates - reference) ** 2).mean(axis=0)) / np.abs(reference)
+            curves[name].append({'paths': n, 'ms': elapsed_ms, **dict(zip(STATISTICS, errors.tolist()))})
+            print(f"{name:<16}{n:>8}" + ''.join(f"{e:>12.4f}" for e in errors) + f"{elapsed_ms:>10.1f}")
+
+    # Paths each mode needs for the p5 error plain random sampling reaches
+    # at the largest path count, by log-log interpolation of its curve.
+    target = curves['random'][-1]['p5'] if 'random' in curves else None
+    if target:
+        print(f"\npaths needed for p5 error {target:.4f}:")
+        for name, curve in curves.items():
+            counts = np.log([point['paths'] for point in curve])
+            errors = np.log([point['p5'] for point in curve])
+            slope, intercept = np.polyfit(counts, errors, 1)
+            print(f"  {name:<16}{np.exp((np.log(target) - intercept) / slope):>10.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'reference': dict(zip(STATISTICS, reference.tolist())),
+                       'curves': curves}, f, indent=2)
+        print(f"\nSaved curves to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+# Synthetic price files in the same layout as stock_data_with_sector.csv:
+#
+#   Price,Close,Close,...,Low,...,Open,...,Volume,...
+#   Industry,<industry per column>
+#   Ticker,<ticker per column>
+#   Date,,,...
+#   <one row per trading day>
+#
+# Prices follow a one-factor lognormal random walk so the covariance matrix
+# is realistic (correlated, full rank); a few tickers start late so the
+# ffill/bfill path of the loader is exercised too.
+
+INDUSTRIES = ['Technology', 'Healthcare', 'Financial Services', 'Energy', 'Industrials', 'Consumer Cyclical']
+
+
+def synthetic_tickers(n_tickers):
+    # The last column is the ^GSPC benchmark used by the backtester.
+    return [f'SYN{i:04d}' for i in range(n_tickers - 1)] + ['^GSPC']
+
+
+def generate_wide_csv(path, n_tickers=50, n_years=20, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('1990-01-02', periods=n_years * 252)
+    tickers = synthetic_tickers(n_tickers)
+    industries = [INDUSTRIES[i % len(INDUSTRIES)] for i in range(n_tickers)]
+
+    market = rng.normal(0.0003, 0.01, (len(dates), 1))
+    betas = rng.uniform(0.5, 1.5, n_tickers)
+    idio = rng.normal(0.0001, 0.012, (len(dates), n_tickers))
+    close = 50.0 * np.exp(np.cumsum(market * betas + idio, axis=0))
+    for j in range(0, n_tickers - 1, 7):
+        close[:rng.integers(1, len(dates) // 4), j] = np.nan
+
+    blocks = {
+        'Close': close,
+        'Low': close * 0.99,
+        'Open': close * 1.001,
+        'Volume': np.where(np.isnan(close), np.nan, 1e6),
+    }
+    header = ['Price']
+    industry_row = ['Industry']
+    ticker_row = ['Ticker']
+    for attr in blocks:
+        header += [attr] * n_tickers
+        industry_row += industries
+        ticker_row += tickers
+    body = np.hstack(list(blocks.values()))
+
+    frame = pd.DataFrame(body, index=dates.strftime('%Y-%m-%d'))
+    with open(path, 'w') as f:
+        f.write(','.join(header) + '\n')
+        f.write(','.join(industry_row) + '\n')
+        f.write(','.join(ticker_row) + '\n')
+        f.write('Date' + ',' * (4 * n_tickers) + '\n')
+        frame.to_csv(f, header=False, float_format='%.6f')
+    return tickers
@@ -0,0 +1,183 @@
+import math
+import numpy as np
+
+# Vectorized historical backtests for /multi_portfolio_backtest.
+#
+# All requested portfolios are stacked into one (portfolios x assets) weight
+# matrix over the union of their tickers and every metric is computed
+# column-wise over (months x portfolios) arrays.
+#
+# Holdings are tracked per asset in one contiguous (portfolios x assets)
+# array: they drift with their own returns and are reset to the target
+# weights only at the end of each rebalancing period. Between two
+# rebalances the holdings path is a cumulative product, so each period is a
+# handful of array ops whatever the number of portfolios.
+
+
+def build_weight_matrix(portfolios_config):
+    # Returns (tickers, weights) where tickers is the union of all portfolio
+    # tickers in order of first appearance and weights is (P x len(tickers)).
+    tickers = []
+    index = {}
+    for pconfig in portfolios_config:
+        for ticker in pconfig.get("weights", {}):
+            if ticker not in index:
+                index[ticker] = len(tickers)
+                tickers.append(ticker)
+    weights = np.zeros((len(portfolios_config), len(tickers)))
+    for p, pconfig in enumerate(portfolios_config):
+        for ticker, weight in pconfig.get("weights", {}).items():
+            weights[p, index[ticker]] = weight
+    return tickers, weights
+
+
+def apply_withdrawals(portfolio_returns, initial_capital, withdrawal_amount, period_length):
+    """Balances (months x portfolios) after compounding and withdrawals.
+
+    A withdrawal is taken at the end of every period_length months and the
+    balance is floored at zero, i.e. the recurrence
+    b[t] = max(b[t-1] * (1 + r[t]) - W[t], 0).
+    """
+    growth_factors = 1.0 + portfolio_returns
+    n_months, n_portfolios = portfolio_returns.shape
+    withdrawals = np.zeros(n_months)
+    if period_length and withdrawal_amount:
+        withdrawals[period_length - 1::period_length] = withdrawal_amount
+
+    if not withdrawals.any():
+        return initial_capital * np.cumprod(growth_factors, axis=0)
+
+    if withdrawal_amount > 0 and np.all(growth_factors > 0):
+        # Closed form: with G[t] = prod(1 + r[:t+1]),
+        # b[t] = G[t] * (b0 - sum_{k<=t} W[k] / G[k]). The bracket only
+        # decreases, so once it goes negative the floored balance stays at
+        # zero - exactly what the floor in the recurrence does.
+        growth = np.cumprod(growth_factors, axis=0)
+        remaining = initial_capital - np.cumsum(withdrawals[:, None] / growth, axis=0)
+        return np.maximum(growth * remaining, 0.0)
+
+    # General case (contributions or total-loss months): step through time,
+    # still vectorized across portfolios.
+    balances = np.empty_like(growth_factors)
+    balance = np.full(n_portfolios, float(initial_capital))
+    for t in range(n_months):
+        balance = np.maximum(balance * growth_factors[t] - withdrawals[t], 0.0)
+        balances[t] = balance
+    return balances
+
+
+def _masked_std(values, mask):
+    # Population std of values[mask] per column (0 where nothing is masked).
+    count = mask.sum(axis=0)
+    safe = np.maximum(count, 1)
+    mean = np.where(mask, values, 0.0).sum(axis=0) / safe
+    var = np.where(mask, (values - mean) ** 2, 0.0).sum(axis=0) / safe
+    return np.where(count > 0, np.sqrt(var), 0.0)
+
+
+def compute_backtest_metrics(portfolio_returns, balances, initial_capital, market_returns=None, risk_free_rate=0.04):
+    """Per-portfolio metrics as arrays of length P.
+
+    portfolio_returns and balances are (months x portfolios); market_returns
+    is an optional (months,) array aligned with them.
+    """
+    n_months = portfolio_returns.shape[0]
+    years = n_months / 12.0
+    final_balance = balances[-1]
+    if years > 0:
+        cagr = (final_balance / initial_capital) ** (1 / years) - 1
+    else:
+        cagr = np.zeros_like(final_balance)
+
+    std = portfolio_returns.std(axis=0)
+    ann_stdev = std * math.sqrt(12)
+
+    peak = np.maximum.accumulate(balances, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = (balances - peak) / peak
+    max_drawdown = np.nanmin(np.where(np.isfinite(drawdown), drawdown, np.nan), axis=0, initial=0.0)
+
+    mean_monthly_excess = (portfolio_returns - (risk_free_rate / 12.0)).mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe_ratio = np.where(std > 1e-9, (mean_monthly_excess * 12.0) / (std * math.sqrt(12)), 0.0)
+
+    down_stdev = _masked_std(portfolio_returns, portfolio_returns < 0) * math.sqrt(12)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sortino_ratio = np.where(down_stdev > 1e-9, (mean_monthly_excess * 12.0) / down_stdev, 0.0)
+
+    market_correlation = None
+    if market_returns is not None and len(market_returns) == n_months and n_months > 1:
+        centered = portfolio_returns - portfolio_returns.mean(axis=0)
+        market_centered = market_returns - market_returns.mean()
+        denom = np.sqrt((centered ** 2).sum(axis=0) * (market_centered ** 2).sum())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            market_correlation = np.where(denom > 0, market_centered @ centered / denom, np.nan)
+
+    return {
+        'final_balance': final_balance,
+        'CAGR': cagr * 100,
+        'stdev': ann_stdev * 100,
+        'max_drawdown': max_drawdown * 100,
+        'sharpe_ratio': sharpe_ratio,
+        'sortino_ratio': sortino_ratio,
+        'market_correlation': market_correlation,
+    }
+
+
+def run_backtest(asset_returns, weights, initial_capital, withdrawal_amount=0, period_length=None):
+    """Backtest every portfolio over (months x assets) asset_returns.
+
+    weights is (portfolios x assets) and is used as given: whatever a row
+    leaves of 1 is held as zero-return cash, which drifts and is rebalanced
+    along with the assets. Every period_length months the withdrawal is
+    taken and the holdings are rebalanced to target; with period_length None
+    they are bought and held. Returns (portfolio_returns, balances), both
+    (months x portfolios).
+    """
+    asset_returns = np.asarray(asset_returns, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    if period_length == 1:
+        # Rebalanced every month: the weights never drift, so the fixed-weight
+        # returns and the closed-form withdrawal recurrence are exact.
+        portfolio_returns = asset_returns @ weights.T
+        balances = apply_withdrawals(portfolio_returns, initial_capital, withdrawal_amount, period_length)
+        return portfolio_returns, balances
+
+    # The cash remainder is carried as one more asset with zero returns.
+    targets = np.hstack([weights, 1.0 - weights.sum(axis=1, keepdims=True)])
+    asset_returns = np.hstack([asset_returns, np.zeros((asset_returns.shape[0], 1))])
+
+    n_months = asset_returns.shape[0]
+    n_portfolios = targets.shape[0]
+    holdings = np.ascontiguousarray(initial_capital * targets)
+    balances = np.empty((n_months, n_portfolios))
+    portfolio_returns = np.empty((n_months, n_portfolios))
+    previous = np.full(n_portfolios, float(initial_capital))
+    step = period_length or max(n_months, 1)
+
+    for start in range(0, n_months, step):
+        end = min(start + step, n_months)
+        growth = np.cumprod(1.0 + asset_returns[start:end], axis=0)
+        values = growth @ holdings.T
+        holdings *= growth[-1]
+
+        prior = np.vstack([previous, values[:-1]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # A depleted portfolio has no holdings left; report the target
+            # mix return so its risk metrics stay defined.
+            portfolio_returns[start:end] = np.where(
+                prior > 0, values / prior - 1, asset_returns[start:end] @ targets.T
+            )
+        balances[start:end] = values
+
+        if period_length and end - start == step:
+            balance = values[-1] - withdrawal_amount
+            np.maximum(balance, 0.0, out=balance)
+            balances[end - 1] = balance
+            np.multiply(balance[:, None], targets, out=holdings)
+            previous = balance
+        else:
+            previous = values[-1]
+
+    return portfolio_returns, balances
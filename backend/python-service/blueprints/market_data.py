@@ -0,0 +1,349 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+# Columnar binary snapshot of stock_data_with_sector.csv.
+#
+# Parsing the wide CSV (melt -> pivot_table -> pivot -> resample) is slow and
+# memory hungry, so it is done once by compile_snapshot() and the result is
+# stored next to the CSV as plain .npy arrays. <csv>.snapshot is a symlink
+# to the current versioned directory holding:
+#
+#   manifest.json       csv hash/stat, ticker list and ticker -> industry map
+#   daily_dates.npy     datetime64[ns] trading dates
+#   daily_close.npy     float64 (tickers x dates), NaN where a ticker has no quote
+#   monthly_dates.npy   datetime64[ns] month ends
+#   monthly_close.npy   float64 (tickers x months), ffilled/bfilled month-end closes
+#
+# Prices are stored one row per ticker so each ticker's history is contiguous
+# on disk. The arrays are memory-mapped on load and wrapped in DataFrames
+# without copying. The snapshot is rebuilt automatically when the CSV hash
+# no longer matches the manifest.
+
+CSV_PATH = os.environ.get(
+    'MARKET_DATA_CSV',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'stock_data_with_sector.csv')
+)
+SNAPSHOT_FORMAT_VERSION = 2
+# How often (seconds) get_store() stats the CSV to pick up a changed file.
+MARKET_DATA_CHECK_INTERVAL = float(os.environ.get('MARKET_DATA_CHECK_INTERVAL', 30))
+
+
+def snapshot_dir_for(csv_path):
+    base, _ = os.path.splitext(os.path.abspath(csv_path))
+    return base + '.snapshot'
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_wide_csv(csv_path):
+    # Returns the daily close pivot (Date x Ticker, not filled) and a
+    # ticker -> industry mapping.
+    df_wide = pd.read_csv(csv_path)
+    industry_row = df_wide.iloc[0]
+    ticker_row = df_wide.iloc[1]
+
+    data_part = df_wide.iloc[3:].copy()
+    data_part.rename(columns={'Price': 'Date'}, inplace=True)
+    data_part['Date'] = pd.to_datetime(data_part['Date'], errors='coerce')
+
+    long_df = pd.melt(data_part, id_vars='Date', var_name='ColName', value_name='Value')
+    ticker_map = dict(zip(ticker_row.index, ticker_row.values))
+    industry_map = dict(zip(industry_row.index, industry_row.values))
+
+    long_df['Ticker'] = long_df['ColName'].map(ticker_map)
+    long_df['Industry'] = long_df['ColName'].map(industry_map)
+    long_df.dropna(subset=['Value'], inplace=True)
+    long_df.reset_index(drop=True, inplace=True)
+
+    def get_attribute(col_name):
+        for attr in ['Close', 'Low', 'Open', 'Volume']:
+            if col_name.startswith(attr):
+                return attr
+        return None
+    long_df['Attribute'] = long_df['ColName'].apply(get_attribute)
+
+    df_long = long_df.pivot_table(
+        index=['Date', 'Ticker', 'Industry'],
+        columns='Attribute',
+        values='Value',
+        aggfunc='first'
+    ).reset_index()
+    df_long.columns.name = None
+    df_long.sort_values(by=['Ticker', 'Date'], inplace=True)
+    df_long.reset_index(drop=True, inplace=True)
+
+    industries = df_long.drop_duplicates('Ticker').set_index('Ticker')['Industry']
+
+    assets_raw = df_long[['Date', 'Ticker', 'Close']].copy()
+    assets_raw['Close'] = pd.to_numeric(assets_raw['Close'], errors='coerce')
+    assets_raw.dropna(subset=['Close'], inplace=True)
+    assets_raw = assets_raw.pivot(index='Date', columns='Ticker', values='Close')
+    assets_raw.sort_index(inplace=True)
+    return assets_raw, industries
+
+
+def to_monthly(daily_close):
+    return daily_close.ffill().bfill().resample('ME').last()
+
+
+def compile_snapshot(csv_path=CSV_PATH, snapshot_dir=None, csv_hash=None):
+    snapshot_dir = snapshot_dir or snapshot_dir_for(csv_path)
+    csv_hash = csv_hash or file_sha256(csv_path)
+    stat = os.stat(csv_path)
+
+    daily_close, industries = parse_wide_csv(csv_path)
+    monthly_close = to_monthly(daily_close)
+    tickers = [str(t) for t in daily_close.columns]
+
+    manifest = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'csv_sha256': csv_hash,
+        'csv_size': stat.st_size,
+        'csv_mtime_ns': stat.st_mtime_ns,
+        'tickers': tickers,
+        'industries': {str(t): str(industries.get(t)) for t in daily_close.columns},
+    }
+
+    # Each compile writes a fresh versioned directory next to the CSV and
+    # then atomically repoints the snapshot_dir symlink at it, so there is
+    # no moment without a complete snapshot. The manifest names its own
+    # directory and the arrays are loaded from there, so a swap between
+    # reading the manifest and the arrays cannot mix two versions.
+    parent = os.path.dirname(snapshot_dir)
+    prefix = '.' + os.path.basename(snapshot_dir) + '-'
+    data_dir = tempfile.mkdtemp(prefix=prefix, dir=parent)
+    link = data_dir + '.link'
+    manifest['data_dir'] = os.path.basename(data_dir)
+    try:
+        np.save(os.path.join(data_dir, 'daily_dates.npy'), daily_close.index.values.astype('datetime64[ns]'))
+        np.save(os.path.join(data_dir, 'daily_close.npy'), np.ascontiguousarray(daily_close.values.T, dtype=np.float64))
+        np.save(os.path.join(data_dir, 'monthly_dates.npy'), monthly_close.index.values.astype('datetime64[ns]'))
+        np.save(os.path.join(data_dir, 'monthly_close.npy'), np.ascontiguousarray(monthly_close.values.T, dtype=np.float64))
+        with open(os.path.join(data_dir, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        os.symlink(manifest['data_dir'], link)
+        if os.path.isdir(snapshot_dir) and not os.path.islink(snapshot_dir):
+            # A plain directory from before versioned snapshots; moved aside
+            # once so the symlink can take its place.
+            os.replace(snapshot_dir, tempfile.mkdtemp(prefix=prefix, dir=parent))
+        previous = os.path.basename(os.path.realpath(snapshot_dir))
+        os.replace(link, snapshot_dir)
+    except Exception:
+        shutil.rmtree(data_dir, ignore_errors=True)
+        if os.path.islink(link):
+            os.remove(link)
+        raise
+    _remove_stale_snapshots(parent, prefix, keep={manifest['data_dir'], previous})
+    return manifest
+
+
+def _remove_stale_snapshots(parent, prefix, keep, min_age=600):
+    # The previous version stays for readers still loading it; older ones
+    # go, except recent entries that may be another process's compile in
+    # progress. Memory-mapped arrays survive the unlink until released.
+    cutoff = time.time() - min_age
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if not name.startswith(prefix) or name in keep:
+            continue
+        try:
+            if os.lstat(path).st_mtime > cutoff:
+                continue
+            if os.path.islink(path):
+                os.remove(path)
+            else:
+                shutil.rmtree(path)
+        except OSError:
+            pass
+
+
+def read_manifest(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_snapshot(csv_path=CSV_PATH):
+    # Returns the manifest of an up-to-date snapshot, compiling it if needed.
+    # Hashing is skipped when size and mtime still match the manifest.
+    snapshot_dir = snapshot_dir_for(csv_path)
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None or manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        print(f"Compiling market data snapshot from {csv_path}...")
+        return compile_snapshot(csv_path, snapshot_dir)
+
+    stat = os.stat(csv_path)
+    if manifest.get('csv_size') == stat.st_size and manifest.get('csv_mtime_ns') == stat.st_mtime_ns:
+        return manifest
+
+    csv_hash = file_sha256(csv_path)
+    if csv_hash != manifest.get('csv_sha256'):
+        print(f"{csv_path} changed, recompiling market data snapshot...")
+        return compile_snapshot(csv_path, snapshot_dir, csv_hash=csv_hash)
+
+    # Same content, only touched: remember the new stat so the next start is fast again.
+    manifest['csv_size'] = stat.st_size
+    manifest['csv_mtime_ns'] = stat.st_mtime_ns
+    with open(os.path.join(snapshot_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def _frame_from_snapshot(snapshot_dir, manifest, prefix):
+    data_dir = os.path.join(os.path.dirname(snapshot_dir), manifest['data_dir'])
+    dates = np.load(os.path.join(data_dir, f'{prefix}_dates.npy'))
+    close = np.load(os.path.join(data_dir, f'{prefix}_close.npy'), mmap_mode='r')
+    # close is (tickers x dates); its transpose is the (dates x tickers) frame
+    # layout pandas stores column-major, so no copy is made.
+    frame = pd.DataFrame(close.T, index=pd.DatetimeIndex(dates, name='Date'),
+                         columns=pd.Index(manifest['tickers'], name='Ticker'), copy=False)
+    return frame
+
+
+def load_assets_monthly(csv_path=CSV_PATH):
+    manifest = ensure_snapshot(csv_path)
+    return _frame_from_snapshot(snapshot_dir_for(csv_path), manifest, 'monthly')
+
+
+class MarketDataStore:
+    # Process-wide view of the market data shared by app.py and the blueprints.
+    #
+    # assets_monthly is the month-end close frame served by the portfolio
+    # endpoints. returns is the matching monthly returns matrix stored one row
+    # per ticker (tickers x months, C-contiguous, read-only), so the history
+    # of a single ticker is a zero-copy slice: returns[ticker_index[ticker]].
+    #
+    # The annualized mean vector and covariance matrix of the whole universe
+    # are computed once per load. Since the price frame is ffilled/bfilled,
+    # every ticker shares the same set of months, so the moments of any
+    # ticker subset are just an index slice of the universe moments.
+    #
+    # get_store() calls check_for_updates(), which stats the CSV at most once
+    # per MARKET_DATA_CHECK_INTERVAL and reloads when its size or mtime moved,
+    # so a replaced CSV reaches the subscribers without a restart.
+
+    def __init__(self, csv_path=CSV_PATH):
+        self.csv_path = csv_path
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.version = None
+        self.assets_monthly = None
+        self.monthly_returns = None
+        self.returns = None
+        self.ticker_index = {}
+        self.mu_annual = None
+        self.cov_annual = None
+        self._csv_stat = None
+        self._checked = time.monotonic()
+        self.reload()
+
+    def reload(self, force=False):
+        # Re-reads the snapshot (recompiling it if the CSV changed). Returns
+        # True when the data actually changed; subscribers are notified then.
+        with self._lock:
+            manifest = ensure_snapshot(self.csv_path)
+            if not force and manifest['csv_sha256'] == self.version:
+                self._csv_stat = (manifest['csv_size'], manifest['csv_mtime_ns'])
+                return False
+            assets_monthly = _frame_from_snapshot(snapshot_dir_for(self.csv_path), manifest, 'monthly')
+            # Empty months are all-NaN rows; dropping them first matches what
+            # the endpoints do on any ticker subset.
+            monthly_returns = assets_monthly.dropna(how='any').pct_change().dropna()
+            returns = np.ascontiguousarray(monthly_returns.values.T)
+            returns.setflags(write=False)
+
+            mu_annual = returns.mean(axis=1) * 12
+            cov_annual = np.atleast_2d(np.cov(returns)) * 12
+            mu_annual.setflags(write=False)
+            cov_annual.setflags(write=False)
+
+            self.assets_monthly = assets_monthly
+            self.returns = returns
+            self.monthly_returns = pd.DataFrame(returns.T, index=monthly_returns.index,
+                                                columns=monthly_returns.columns, copy=False)
+            self.ticker_index = {t: i for i, t in enumerate(assets_monthly.columns)}
+            self.mu_annual = mu_annual
+            self.cov_annual = cov_annual
+            self.version = manifest['csv_sha256']
+            self._csv_stat = (manifest['csv_size'], manifest['csv_mtime_ns'])
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback(self)
+        return True
+
+    def check_for_updates(self, interval=MARKET_DATA_CHECK_INTERVAL):
+        # Cheap stat-based change check, throttled to one stat per interval.
+        # Returns True when it triggered a reload that changed the data.
+        now = time.monotonic()
+        if now - self._checked < interval:
+            return False
+        self._checked = now
+        try:
+            stat = os.stat(self.csv_path)
+        except OSError:
+            return False
+        if (stat.st_size, stat.st_mtime_ns) == self._csv_stat:
+            return False
+        return self.reload()
+
+    def subscribe(self, callback):
+        # callback(store) runs after every reload that changed the data.
+        self._listeners.append(callback)
+
+    def columns_for(self, tickers):
+        # Row indices into returns / mu_annual / cov_annual; raises KeyError
+        # for unknown tickers.
+        return np.array([self.ticker_index[t] for t in tickers], dtype=np.intp)
+
+    def returns_for(self, ticker):
+        # Monthly return history of one ticker as a read-only view, or None.
+        col = self.ticker_index.get(ticker)
+        if col is None:
+            return None
+        return self.returns[col]
+
+    def annualized_moments(self, tickers):
+        # Annualized mean and covariance of a ticker subset (monthly moments
+        # times 12) without touching the price frame.
+        cols = self.columns_for(tickers)
+        mu = pd.Series(self.mu_annual[cols], index=tickers)
+        cov = pd.DataFrame(self.cov_annual[np.ix_(cols, cols)], index=tickers, columns=tickers)
+        return mu, cov
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MarketDataStore()
+                return _store
+    _store.check_for_updates()
+    return _store
+
+
+if __name__ == '__main__':
+    # One-off compile step: python backend/python-service/blueprints/market_data.py [csv_path]
+    import sys
+    path = sys.argv[1] if len(sys.argv) > 1 else CSV_PATH
+    result = compile_snapshot(path)
+    print(f"Compiled {len(result['tickers'])} tickers into {snapshot_dir_for(path)}")
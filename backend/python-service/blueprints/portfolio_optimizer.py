@@ -0,0 +1,313 @@
+import numpy as np
+
+# Long-only, fully-invested quadratic programs used by the allocation and
+# efficient frontier endpoints:
+#
+#   minimize    1/2 w'Qw + c'w
+#   subject to  sum(w) = 1,  w >= 0
+#
+# solved with a primal active-set method. Each iteration solves the KKT
+# system of the equality-constrained problem on the free assets (analytic
+# gradient Qw + c), then either steps to the first blocking bound or, at a
+# stationary point, releases the bound with the most negative multiplier.
+# Without a warm start, the working set is first guessed by repeatedly
+# solving on the free assets and dropping every asset that comes out
+# negative; the active-set iterations then only have to correct that guess,
+# which usually takes a handful of steps even for 100+ assets.
+
+
+def _solve_kkt(Q_ff, c_f):
+    # Stationarity Q_ff w_f + c_f = nu * 1 and sum(w_f) = 1.
+    k = Q_ff.shape[0]
+    kkt = np.empty((k + 1, k + 1))
+    kkt[:k, :k] = Q_ff
+    kkt[:k, k] = -1.0
+    kkt[k, :k] = 1.0
+    kkt[k, k] = 0.0
+    rhs = np.empty(k + 1)
+    rhs[:k] = -c_f
+    rhs[k] = 1.0
+    try:
+        sol = np.linalg.solve(kkt, rhs)
+    except np.linalg.LinAlgError:
+        # Singular covariance on the free set (e.g. duplicated assets): take
+        # the minimum-norm solution, which is still a stationary point.
+        sol = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+    return sol[:k], sol[k]
+
+
+def _guess_working_set(Q, c, max_rounds=20):
+    n = Q.shape[0]
+    active = np.zeros(n, dtype=bool)
+    w = np.zeros(n)
+    for _ in range(max_rounds):
+        free = ~active
+        w_f, _ = _solve_kkt(Q[np.ix_(free, free)], c[free])
+        negative = w_f < 0
+        if not np.any(negative):
+            w[free] = w_f
+            return w, active
+        idx = np.flatnonzero(free)
+        active[idx[negative]] = True
+    # Fall back to the feasible equal-weight start.
+    return np.full(n, 1.0 / n), np.zeros(n, dtype=bool)
+
+
+def solve_long_only_qp(Q, c=None, w0=None, tol=1e-10, max_iter=None):
+    """Minimize 1/2 w'Qw + c'w over the long-only simplex.
+
+    Returns (weights, info) where info holds convergence diagnostics:
+    converged, iterations, kkt_residual, num_active (assets held at zero)
+    and objective.
+    """
+    Q = np.asarray(Q, dtype=np.float64)
+    n = Q.shape[0]
+    c = np.zeros(n) if c is None else np.asarray(c, dtype=np.float64)
+    if max_iter is None:
+        max_iter = 10 * n + 50
+
+    if w0 is None:
+        w, active = _guess_working_set(Q, c)
+    else:
+        w = np.clip(np.asarray(w0, dtype=np.float64), 0.0, None)
+        w /= w.sum()
+        active = w <= 0.0
+    w[active] = 0.0
+
+    # Tolerances are relative to the scale of the problem.
+    scale = max(np.max(np.abs(np.diag(Q))) if n else 0.0, np.max(np.abs(c)) if n else 0.0, 1e-16)
+    step_tol = 1e-12
+    grad_tol = tol * scale
+
+    converged = False
+    nu = 0.0
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        free = ~active
+        w_f, nu = _solve_kkt(Q[np.ix_(free, free)], c[free])
+        p = np.zeros(n)
+        p[free] = w_f - w[free]
+
+        if np.max(np.abs(p)) <= step_tol:
+            # Stationary on the current working set: check bound multipliers.
+            grad = Q @ w + c
+            lam = grad - nu
+            lam[free] = np.inf
+            j = int(np.argmin(lam))
+            if lam[j] >= -grad_tol:
+                converged = True
+                break
+            active[j] = False
+            continue
+
+        # Longest feasible step along p; add the first blocking bound.
+        alpha = 1.0
+        blocking = -1
+        decreasing = free & (p < 0)
+        if np.any(decreasing):
+            idx = np.flatnonzero(decreasing)
+            ratios = -w[idx] / p[idx]
+            k = int(np.argmin(ratios))
+            if ratios[k] < 1.0:
+                alpha = ratios[k]
+                blocking = idx[k]
+        w = w + alpha * p
+        if blocking >= 0:
+            w[blocking] = 0.0
+            active[blocking] = True
+        w[active] = 0.0
+
+    w = np.clip(w, 0.0, None)
+    w /= w.sum()
+
+    grad = Q @ w + c
+    free = ~active
+    residual = 0.0
+    if np.any(free):
+        residual = float(np.max(np.abs(grad[free] - nu)))
+    if np.any(active):
+        residual = max(residual, float(np.max(np.clip(nu - grad[active], 0.0, None))))
+    info = {
+        'converged': converged,
+        'iterations': iterations,
+        'kkt_residual': residual,
+        'num_active': int(active.sum()),
+        'objective': float(0.5 * w @ Q @ w + c @ w),
+    }
+    return w, info
+
+
+def min_variance_weights(cov_matrix, **kwargs):
+    # Long-only global minimum-variance portfolio.
+    return solve_long_only_qp(cov_matrix, **kwargs)
+
+
+# -------------------- Critical line algorithm --------------------
+# Markowitz's critical line algorithm traces the whole long-only frontier
+#
+#   minimize 1/2 w'Qw - lam * mu'w   s.t. sum(w) = 1, w >= 0
+#
+# for lam from +inf down to 0. Between two consecutive turning points the
+# set of free (non-zero) assets is constant and the weights are affine in
+# lam, hence also affine in the portfolio return. The turning points are
+# therefore enough to reconstruct any frontier portfolio exactly by linear
+# interpolation.
+
+RANK_TOL = 1e-9
+
+
+def _full_rank(cov, rel_tol=RANK_TOL):
+    # A rank-deficient covariance (duplicate tickers, fewer months of history
+    # than tickers) makes the free-set blocks singular, or so ill-conditioned
+    # that their inverses are garbage. Lifting the smallest eigenvalue to
+    # rel_tol times the largest bounds the condition number of every block at
+    # 1 / rel_tol (eigenvalue interlacing) and changes any portfolio's
+    # variance by at most rel_tol times the largest eigenvalue.
+    eigvals = np.linalg.eigvalsh(cov)
+    floor = rel_tol * max(eigvals[-1], 0.0)
+    if eigvals[0] >= floor:
+        return cov
+    return cov + (floor - eigvals[0]) * np.eye(len(cov))
+
+
+def critical_line(expected_returns, cov_matrix, tol=1e-12):
+    """Turning points of the long-only efficient frontier.
+
+    Returns an array of weights (num_turning_points x num_assets) ordered
+    from the maximum-return portfolio down to the global minimum-variance
+    portfolio.
+    """
+    mu = np.asarray(expected_returns, dtype=np.float64)
+    cov = _full_rank(np.asarray(cov_matrix, dtype=np.float64))
+    n = len(mu)
+
+    # Start from the maximum-return corner. Assets tied for the highest
+    # return are mixed at minimum variance, which makes the first segment
+    # independent of lam.
+    top = np.flatnonzero(mu >= mu.max() - tol * max(1.0, abs(mu.max())))
+    w = np.zeros(n)
+    if len(top) == 1:
+        w[top[0]] = 1.0
+    else:
+        w_top, _ = solve_long_only_qp(cov[np.ix_(top, top)])
+        w[top] = w_top
+    free = np.flatnonzero(w > 0)
+    turning_points = [w.copy()]
+    lam_prev = np.inf
+
+    # Every bounded weight sits at zero, so on a free set F the solution is
+    # w_F = g * inv(cov_FF) 1 + lam * inv(cov_FF) mu with g fixed by sum(w) = 1.
+    for _ in range(4 * n + 10):
+        cov_f_inv = np.linalg.inv(cov[np.ix_(free, free)])
+        inv_ones = cov_f_inv.sum(axis=1)
+        inv_mu = cov_f_inv @ mu[free]
+        c1 = inv_ones.sum()
+        c3 = inv_mu.sum()
+
+        # a) a free weight falls to zero; only weights that shrink as lam
+        #    decreases (c < 0) can do so.
+        lam_in, j_in = -np.inf, -1
+        if len(free) > 1:
+            c = -c1 * inv_mu + c3 * inv_ones
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lam = np.where(c < 0, inv_ones / c, -np.inf)
+            lam[lam >= lam_prev] = -np.inf
+            j_in = int(np.argmax(lam))
+            lam_in = lam[j_in]
+
+        # b) a zero weight becomes free. The inverse of each bordered matrix
+        #    [[cov_FF, b], [b', d]] is an O(k^2) update of inv(cov_FF), so all
+        #    candidates are evaluated at once.
+        lam_out, i_out = -np.inf, -1
+        bounded = np.setdiff1d(np.arange(n), free)
+        if len(bounded):
+            cov_fb = cov[np.ix_(free, bounded)]
+            u = cov_f_inv @ cov_fb
+            schur = cov[bounded, bounded] - np.einsum('ij,ij->j', cov_fb, u)
+            u_ones = u.sum(axis=0)
+            u_mu = mu[free] @ u
+            with np.errstate(divide='ignore', invalid='ignore'):
+                last_ones = (1 - u_ones) / schur
+                last_mu = (mu[bounded] - u_mu) / schur
+                c1_aug = c1 + (u_ones - 1) ** 2 / schur
+                c3_aug = c3 + (u_ones - 1) * (u_mu - mu[bounded]) / schur
+                c = -c1_aug * last_mu + c3_aug * last_ones
+                # only weights that grow as lam decreases can enter; this also
+                # stops a weight that just left from re-entering
+                lam = np.where((c > 0) & (schur > 0), last_ones / c, -np.inf)
+            lam[~np.isfinite(lam) | (lam >= lam_prev)] = -np.inf
+            k = int(np.argmax(lam))
+            lam_out, i_out = lam[k], bounded[k]
+
+        if lam_in < 0 and lam_out < 0:
+            lam_new = 0.0
+        elif lam_in > lam_out:
+            lam_new = lam_in
+            w[free[j_in]] = 0.0
+            free = np.delete(free, j_in)
+        else:
+            lam_new = lam_out
+            free = np.append(free, i_out)
+
+        cov_f_inv = np.linalg.inv(cov[np.ix_(free, free)])
+        inv_ones = cov_f_inv.sum(axis=1)
+        inv_mu = cov_f_inv @ mu[free]
+        g = (1 - lam_new * inv_mu.sum()) / inv_ones.sum()
+        w[free] = g * inv_ones + lam_new * inv_mu
+        w[np.abs(w) < tol] = 0.0
+        turning_points.append(w.copy())
+        lam_prev = lam_new
+        if lam_new == 0.0:
+            break
+
+    points = np.clip(np.array(turning_points), 0.0, None)
+    points /= points.sum(axis=1, keepdims=True)
+    return points
+
+
+def interpolate_frontier(turning_points, expected_returns, target_returns):
+    # Frontier weights for each target return, given turning points ordered
+    # by decreasing return. Targets outside the traced range are clamped.
+    mu = np.asarray(expected_returns, dtype=np.float64)
+    targets = np.asarray(target_returns, dtype=np.float64)
+    if len(turning_points) == 1:
+        return np.repeat(turning_points[:1], len(targets), axis=0)
+    rets = turning_points @ mu
+    # searchsorted needs ascending returns
+    rets_asc = rets[::-1]
+    points_asc = turning_points[::-1]
+    hi = np.clip(np.searchsorted(rets_asc, targets), 1, len(rets_asc) - 1)
+    lo = hi - 1
+    span = rets_asc[hi] - rets_asc[lo]
+    s = np.where(span > 0, (targets - rets_asc[lo]) / np.where(span > 0, span, 1.0), 0.0)
+    s = np.clip(s, 0.0, 1.0)[:, None]
+    return points_asc[lo] + s * (points_asc[hi] - points_asc[lo])
+
+
+def max_sharpe_on_frontier(turning_points, expected_returns, cov_matrix, risk_free_rate):
+    # Tangent portfolio: the Sharpe ratio along a frontier segment
+    # w(s) = a + s (b - a) has a closed-form maximizer, so each segment is
+    # checked exactly instead of running a nonlinear solver.
+    mu = np.asarray(expected_returns, dtype=np.float64)
+    cov = np.asarray(cov_matrix, dtype=np.float64)
+    best_w, best_sr = None, -np.inf
+    candidates = [turning_points[0]]
+    for a, b in zip(turning_points[:-1], turning_points[1:]):
+        d = b - a
+        # excess return r(s) = ra + rb s, variance v(s) = va + 2 vab s + vb s^2
+        ra, rb = a @ mu - risk_free_rate, d @ mu
+        va, vab, vb = a @ cov @ a, a @ cov @ d, d @ cov @ d
+        denom = rb * vab - ra * vb
+        if denom != 0:
+            s = (ra * vab - rb * va) / denom
+            if 0.0 < s < 1.0:
+                candidates.append(a + s * d)
+        candidates.append(b)
+    for w in candidates:
+        vol = np.sqrt(max(w @ cov @ w, 0.0))
+        if vol <= 0:
+            continue
+        sr = (w @ mu - risk_free_rate) / vol
+        if sr > best_sr:
+            best_w, best_sr = w, sr
+    return best_w
@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Bounded in-memory LRU cache for endpoint results.
+#
+# Entries are accounted by their estimated size in bytes and the least
+# recently used ones are evicted once max_bytes is exceeded. Keys must be
+# hashable and should already contain everything the result depends on
+# (canonical inputs plus a data version stamp), so a stale entry can never
+# be hit; clear() is still called on data reloads to free the memory.
+# DiskCache is a persistent tier for JSON results keyed by content hashes,
+# and TieredCache puts an LRUCache in front of it.
+
+
+def estimate_size(obj, _seen=None):
+    # Rough deep size of JSON-like results (dicts, lists, scalars, arrays).
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (0 if obj.base is not None else obj.nbytes)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += estimate_size(k, _seen) + estimate_size(v, _seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += estimate_size(item, _seen)
+    return size
+
+
+class LRUCache:
+    def __init__(self, max_bytes, name='cache'):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            if size > self.max_bytes:
+                # Larger than the whole budget: never cache it.
+                return False
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class DiskCache:
+    """Byte-budgeted cache of JSON values in a directory, one file per key.
+
+    Keys must be safe file names (e.g. hex digests). Recency is the file
+    mtime, refreshed on every hit, and the least recently used files are
+    deleted once the directory holds more than max_bytes. Entries survive
+    restarts and can be shared by several server processes.
+    """
+
+    def __init__(self, directory, max_bytes, name='disk'):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.current_bytes = sum(size for _, _, size in self._files())
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _files(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((entry.path, stat.st_mtime, stat.st_size))
+        return files
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return default
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        data = json.dumps(value).encode()
+        if len(data) > self.max_bytes:
+            return False
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            try:
+                self.current_bytes -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+            self.current_bytes += len(data)
+            if self.current_bytes > self.max_bytes:
+                self._evict()
+        return True
+
+    def _evict(self):
+        # Rescan so files written by other processes are accounted too.
+        files = sorted(self._files(), key=lambda item: item[1])
+        self.current_bytes = sum(size for _, _, size in files)
+        for path, _, size in files:
+            if self.current_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._files():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'directory': self.directory,
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class TieredCache:
+    # In-memory LRU in front of an optional DiskCache; disk hits are
+    # promoted into memory.
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key, default=None):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return default if value is None else value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        return {
+            'memory': self.memory.stats(),
+            'disk': self.disk.stats() if self.disk is not None else None,
+        }
+
+
+def canonical_order(items):
+    # Sorted tuple used in cache keys, plus the permutation needed to map
+    # per-item results computed in that order back to the caller's order.
+    order = sorted(range(len(items)), key=lambda i: items[i])
+    return tuple(items[i] for i in order), order
+
+
+def restore_order(values, order):
+    restored = [None] * len(order)
+    for k, i in enumerate(order):
+        restored[i] = values[k]
+    return restored
@@ -0,0 +1,447 @@
+import os
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+import numpy as np
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+# Vectorized Monte Carlo path generation for /api/simulator.
+#
+# Every generator draws the shocks for all paths at once from an explicit
+# numpy Generator (no global seeding) and works on (paths x periods x assets)
+# arrays. Balances are then advanced one year at a time across all paths, so
+# the remaining Python loop is over years only, never over paths or assets.
+# Scenarios share the shocks (common random numbers): each one only applies
+# its own location and scale to them.
+#
+# The normal, parameterized and GARCH models take their standard normal
+# shocks from a NormalSampler, which can use antithetic pairs or scrambled
+# Sobol points instead of plain pseudo-random draws.
+#
+# Large requests are split into fixed-size path shards (run_sharded). Shard i
+# always draws from the i-th child of SeedSequence(random_seed), so a seed
+# gives the same paths whether the shards run in-process or on a process
+# pool of any size. The pool is opt-in (SIMULATOR_WORKERS > 1), started on
+# first use unless SIMULATOR_WARM_POOL is set, and each worker imports
+# blueprints.simulation_worker before taking its first shard.
+
+SHARD_PATHS = 5000
+SIMULATOR_WORKERS = max(1, int(os.environ.get('SIMULATOR_WORKERS', 1)))
+SIMULATOR_WARM_POOL = os.environ.get('SIMULATOR_WARM_POOL', '').lower() in ('1', 'true', 'yes')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def cholesky_factor(cov_matrix):
+    """Lower-triangular L with L L' = cov_matrix.
+
+    Falls back to an eigenvalue square root when the matrix is only positive
+    semi-definite (e.g. perfectly correlated assets or a zero volatility),
+    where a plain Cholesky factorization fails.
+    """
+    cov = np.asarray(cov_matrix, dtype=np.float64)
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        eigvals, eigvecs = np.linalg.eigh((cov + cov.T) / 2)
+        return eigvecs * np.sqrt(np.clip(eigvals, 0.0, None))
+
+
+def simulate_scenarios(draw_shocks, transforms, weights, initial_amount, years, periods_per_year,
+                       num_simulations, cashflow=None, rebalance_every=1, dtype=np.float64):
+    """(scenarios x portfolios x num_simulations x years) year-end balances
+    with common random numbers across scenarios and portfolios.
+
+    draw_shocks(n) returns the shocks for the next n periods of every path;
+    it is called once per year and the same shocks are turned into each
+    scenario's (num_simulations x n x assets) asset returns by
+    transforms[s](shocks). weights is (portfolios x assets), so every
+    portfolio is run against the same asset paths. Holdings are a
+    (portfolios x paths x assets) array per scenario that grows with each
+    period's returns and is reset to the target weights every
+    rebalance_every periods; at every year end the cashflow is applied to the
+    totals and the holdings are rebalanced. Holdings and balances are kept
+    in dtype (float32 halves their memory).
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=dtype))
+    targets = weights[:, None, :]
+    holdings = np.empty((len(transforms), len(weights), num_simulations, weights.shape[1]), dtype=dtype)
+    holdings[:] = initial_amount * targets
+    portfolio_values = np.empty((len(transforms), len(weights), num_simulations, years), dtype=dtype)
+    for y in range(years):
+        shocks = draw_shocks(periods_per_year)
+        for s, transform in enumerate(transforms):
+            period_returns = transform(shocks).astype(dtype, copy=False)
+            scenario_holdings = holdings[s]
+            for p in range(periods_per_year):
+                scenario_holdings *= 1 + period_returns[:, p]
+                if (p + 1) % rebalance_every == 0 and p + 1 < periods_per_year:
+                    np.multiply(scenario_holdings.sum(axis=2, keepdims=True), targets, out=scenario_holdings)
+            totals = scenario_holdings.sum(axis=2)
+            if cashflow is not None:
+                totals = cashflow(totals, y + 1).astype(dtype, copy=False)
+            np.multiply(totals[:, :, None], targets, out=scenario_holdings)
+            portfolio_values[s, :, :, y] = totals
+    return portfolio_values
+
+
+SAMPLING_MODES = ('random', 'antithetic', 'sobol')
+
+
+def power_of_two_below(n):
+    # Largest power of two <= n (1 for n < 2).
+    return 1 << (max(int(n), 1).bit_length() - 1)
+
+
+def sobol_path_count(n):
+    # n rounded to the nearest power of two, the path counts at which a
+    # Sobol sample is balanced.
+    if n < 1:
+        return n
+    low = power_of_two_below(n)
+    return 2 * low if n - low > 2 * low - n else low
+
+
+class NormalSampler:
+    """Standard normal shocks for consecutive blocks (years) of every path.
+
+    Each call sampler(n) returns the next block of n periods as
+    (num_simulations x n x dims) and n_blocks calls cover the horizon.
+
+      random      plain pseudo-random draws, the same as rng.standard_normal
+      antithetic  the second half of the paths mirrors the first (z, -z)
+      sobol       each path is one point of a scrambled Sobol sequence over
+                  (n_blocks x dims), mapped through the inverse normal CDF.
+                  The point fixes each block's total shock; the periods
+                  within a block are filled in with a Brownian bridge
+                  (pseudo-random deviations around the block mean), which
+                  keeps the period shocks iid N(0, 1) while the Sobol
+                  dimension stays years x assets.
+
+    Sobol points are only balanced in sets of a power of two, and each
+    sampler (one per path shard) scrambles its own sequence. For any other
+    num_simulations the first num_simulations points of the next power of
+    two are used, which loses most of the advantage over random draws, so
+    callers should keep shard sizes at powers of two (see sobol_path_count
+    and power_of_two_below).
+
+    With moment_matching every block is also rescaled to zero mean and unit
+    variance across paths.
+    """
+
+    def __init__(self, rng, num_simulations, dims, n_blocks, mode='random', moment_matching=False):
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"sampling_mode must be one of {', '.join(SAMPLING_MODES)}.")
+        self.rng = rng
+        self.num_simulations = num_simulations
+        self.dims = dims
+        self.mode = mode
+        self.moment_matching = moment_matching
+        self.block = 0
+        if mode == 'sobol':
+            dimension = n_blocks * dims
+            if dimension > qmc.Sobol.MAXDIM:
+                raise ValueError(f"Sobol sampling supports at most {qmc.Sobol.MAXDIM} years x assets.")
+            # The first num_simulations points of the next power of two.
+            m = max(int(np.ceil(np.log2(max(num_simulations, 1)))), 0)
+            u = qmc.Sobol(dimension, scramble=True, seed=rng).random_base2(m)[:num_simulations]
+            eps = np.finfo(np.float64).eps
+            self.block_shocks = ndtri(np.clip(u, eps, 1 - eps)).reshape(num_simulations, n_blocks, dims)
+
+    def __call__(self, n):
+        shape = (self.num_simulations, n, self.dims)
+        if self.mode == 'antithetic':
+            half = self.rng.standard_normal((-(-self.num_simulations // 2), n, self.dims))
+            z = np.concatenate([half, -half])[:self.num_simulations]
+        else:
+            z = self.rng.standard_normal(shape)
+        if self.mode == 'sobol':
+            block_total = self.block_shocks[:, self.block, None, :]
+            z = z - z.mean(axis=1, keepdims=True) + block_total / np.sqrt(n)
+        self.block += 1
+        if self.moment_matching and self.num_simulations > 1:
+            z = (z - z.mean(axis=0)) / z.std(axis=0)
+        return z
+
+
+class GarchPathGenerator:
+    """GARCH(1,1) returns for every (path, asset) advanced together.
+
+        r_t = mu + eps_t,  eps_t = sigma_t z_t
+        sigma2_t = omega + alpha * eps_{t-1}^2 + beta * sigma2_{t-1}
+
+    mu and omega are per-asset arrays, alpha and beta are shared. Like
+    arch's simulate, the variance starts at its unconditional level
+    omega / (1 - alpha - beta) and the first burn steps are discarded; the
+    burn-in runs once for the whole (paths x assets) state rather than once
+    per model. With chol (a factor of the innovation correlation matrix) the
+    innovations z_t are correlated across assets.
+
+    draw(n) returns the next n periods as (paths x n x assets) and keeps the
+    variance state, so consecutive calls continue the same paths. With a
+    sampler (a NormalSampler) the z_t of each draw come from it; the burn-in
+    always uses plain draws from rng.
+    """
+
+    def __init__(self, rng, mu, omega, alpha, beta, num_simulations, chol=None, burn=500, sampler=None):
+        self.rng = rng
+        self.mu = np.asarray(mu, dtype=np.float64)
+        self.omega = np.asarray(omega, dtype=np.float64)
+        self.alpha = alpha
+        self.beta = beta
+        self.chol = chol
+        self.sampler = sampler
+        self.num_simulations = num_simulations
+        persistence = alpha + beta
+        start = self.omega / (1 - persistence) if persistence < 1 else self.omega
+        self.sigma2 = np.empty((num_simulations, len(self.mu)))
+        self.sigma2[:] = start
+        for _ in range(burn):
+            self._step()
+
+    def _step(self, z=None):
+        if z is None:
+            z = self.rng.standard_normal(self.sigma2.shape)
+        if self.chol is not None:
+            z = z @ self.chol.T
+        eps = np.sqrt(self.sigma2) * z
+        self.sigma2 = self.omega + self.alpha * eps ** 2 + self.beta * self.sigma2
+        return eps
+
+    def draw(self, n):
+        returns = np.empty((self.num_simulations, n, len(self.mu)))
+        shocks = self.sampler(n) if self.sampler is not None else None
+        for t in range(n):
+            returns[:, t] = self.mu + self._step(None if shocks is None else shocks[:, t])
+        return returns
+
+
+def bootstrap_indices(rng, n_history, num_simulations, n_months, block_length=1, block_type='fixed'):
+    """(num_simulations x n_months) indices into an n_history-month sample.
+
+    With block_length 1 every month is drawn independently. Otherwise months
+    are taken in consecutive runs that wrap around the end of the history:
+    'fixed' blocks all have block_length months, 'stationary' blocks (Politis
+    and Romano) have geometric lengths with mean block_length. The same index
+    is used for every asset, so cross-asset correlation is preserved.
+    """
+    dtype = np.int32 if n_history < 2 ** 31 else np.int64
+    if block_length <= 1:
+        return rng.integers(0, n_history, size=(num_simulations, n_months), dtype=dtype)
+    offsets = np.arange(n_months)
+    if block_type == 'stationary':
+        new_block = rng.random((num_simulations, n_months)) < 1.0 / block_length
+        new_block[:, 0] = True
+        starts = rng.integers(0, n_history, size=(num_simulations, n_months))
+        block_start = np.maximum.accumulate(np.where(new_block, offsets, 0), axis=1)
+        idx = np.take_along_axis(starts, block_start, axis=1) + (offsets - block_start)
+    else:
+        n_blocks = -(-n_months // block_length)
+        starts = rng.integers(0, n_history, size=(num_simulations, n_blocks))
+        idx = (starts[:, :, None] + np.arange(block_length)).reshape(num_simulations, -1)[:, :n_months]
+    return (idx % n_history).astype(dtype)
+
+
+def bootstrap_draw(returns, indices, months_per_period):
+    """draw_shocks from bootstrapped history.
+
+    returns is the shared (months x assets) history and indices the
+    (paths x total_months) matrix from bootstrap_indices. Each call gathers
+    the next n periods for all assets in one indexing op, as
+    (paths x n x months_per_period x assets) monthly returns.
+    """
+    num_simulations = indices.shape[0]
+    position = [0]
+
+    def draw(n):
+        start = position[0]
+        position[0] = start + n * months_per_period
+        monthly = returns[indices[:, start:position[0]]]
+        return monthly.reshape(num_simulations, n, months_per_period, -1)
+
+    return draw
+
+
+def compound_months(monthly, adjustment=0.0):
+    # Period returns from (paths x periods x months x assets) monthly returns.
+    return np.prod(1 + monthly + adjustment, axis=2) - 1
+
+
+class CashflowSchedule:
+    """Year-end cashflows compiled once per request.
+
+    For year y (1-based) the balances become
+    max(balances * (1 - rates[y-1]) + amounts[y-1], 0): rates are the
+    fraction withdrawn, amounts the signed fixed cashflow (negative for
+    withdrawals). Withdrawals never take a balance below zero; a later
+    contribution still adds to a balance that has been floored there.
+    """
+
+    def __init__(self, amounts, rates):
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+        self.rates = np.asarray(rates, dtype=np.float64)
+
+    def __call__(self, balances, year):
+        rate = self.rates[year - 1]
+        amount = self.amounts[year - 1]
+        if rate:
+            balances = balances * (1 - rate)
+        if amount:
+            balances = balances + amount
+        return np.maximum(balances, 0.0)
+
+
+# -------------------- Path sharding --------------------
+def get_pool():
+    # Process pool shared by all requests. Workers are spawned rather than
+    # forked so they never inherit the web server's threads or locks; the
+    # initializer imports the shard functions' modules once per worker.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=SIMULATOR_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=importlib.import_module,
+                    initargs=(__name__.rpartition('.')[0] + '.simulation_worker',))
+    return _pool
+
+
+def warm_pool():
+    # Start every worker up front so the first pooled request does not pay
+    # for spawning and importing (several seconds). Opt-in with
+    # SIMULATOR_WARM_POOL, and a no-op unless pooling is enabled. Spawned
+    # workers re-import the entry script (app.py) before their bootstrap
+    # finishes, so the call must not start processes from inside one.
+    if SIMULATOR_WORKERS <= 1 or not SIMULATOR_WARM_POOL:
+        return
+    if multiprocessing.current_process().name != 'MainProcess':
+        return
+    pool = get_pool()
+    for future in [pool.submit(os.getpid) for _ in range(SIMULATOR_WORKERS)]:
+        future.result()
+
+
+def shard_sizes(num_paths, shard_paths=SHARD_PATHS):
+    n_shards = max(1, -(-num_paths // shard_paths))
+    return [min(shard_paths, num_paths - i * shard_paths) for i in range(n_shards)]
+
+
+def _run_shard(worker, args, seed_seq, n_paths, shm_name, shape, start, dtype=np.float64):
+    # Runs in a pool process and writes its rows straight into the parent's
+    # shared block, so only the small arguments are pickled.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        out[start:start + n_paths] = worker(args, np.random.default_rng(seed_seq), n_paths)
+        del out
+    finally:
+        shm.close()
+
+
+def _shard_plan(num_paths, seed, shard_paths=SHARD_PATHS):
+    # seed may also be a SeedSequence, e.g. one child per batch of paths.
+    sizes = shard_sizes(num_paths, shard_paths)
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    seeds = root.spawn(len(sizes))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(int)
+    return sizes, [int(start) for start in starts], seeds
+
+
+def _use_pool(n_shards, max_workers):
+    workers = SIMULATOR_WORKERS if max_workers is None else max_workers
+    return n_shards > 1 and workers > 1
+
+
+def run_sharded(worker, args, num_paths, n_columns, seed, max_workers=None, on_shard=None,
+                shard_paths=SHARD_PATHS, dtype=np.float64):
+    """(num_paths x n_columns) results of worker(args, rng, n_paths) run
+    over fixed-size path shards.
+
+    Each shard gets its own Generator spawned from SeedSequence(seed), so the
+    output depends only on seed, num_paths and shard_paths, not on how many
+    workers ran it. With more than one shard and worker (max_workers,
+    default SIMULATOR_WORKERS) the shards run on the process pool, at most
+    max_workers at a time, and are gathered in a shared memory block;
+    otherwise they run one after another here. on_shard(rows) is called
+    with each finished shard's rows, in completion order; an exception it
+    raises abandons the remaining shards.
+    """
+    sizes, starts, seeds = _shard_plan(num_paths, seed, shard_paths)
+    shape = (num_paths, n_columns)
+
+    if not _use_pool(len(sizes), max_workers):
+        out = np.empty(shape, dtype=dtype)
+        for start, n, seed_seq in zip(starts, sizes, seeds):
+            out[start:start + n] = worker(args, np.random.default_rng(seed_seq), n)
+            if on_shard is not None:
+                on_shard(out[start:start + n])
+        return out
+
+    limit = SIMULATOR_WORKERS if max_workers is None else max_workers
+    shm = shared_memory.SharedMemory(create=True, size=max(num_paths * n_columns * np.dtype(dtype).itemsize, 1))
+    out = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    try:
+        pool = get_pool()
+        queued = list(zip(starts, sizes, seeds))
+        running = {}
+        try:
+            while queued or running:
+                while queued and len(running) < limit:
+                    start, n, seed_seq = queued.pop(0)
+                    future = pool.submit(_run_shard, worker, args, seed_seq, n, shm.name, shape, start, dtype)
+                    running[future] = (start, n)
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    start, n = running.pop(future)
+                    future.result()
+                    if on_shard is not None:
+                        # A copy, so no view into the block outlives it.
+                        on_shard(out[start:start + n].copy())
+        finally:
+            # Running shards still write into the block: let them finish
+            # before it is released, even if one failed or was abandoned.
+            for future in running:
+                future.cancel()
+            wait(running)
+        return out.copy()
+    finally:
+        del out
+        shm.close()
+        shm.unlink()
+
+
+def _map_shard(worker, args, seed_seq, n_paths):
+    return worker(args, np.random.default_rng(seed_seq), n_paths)
+
+
+def map_shards(worker, args, num_paths, seed, max_workers=None, shard_paths=SHARD_PATHS):
+    """Yield worker(args, rng, n_paths) for every shard, in shard order.
+
+    Uses the same shards and seed streams as run_sharded, for workers that
+    reduce their paths to something small (e.g. a mergeable summary) so the
+    full path matrix never exists. At most max_workers shards are in
+    flight at a time.
+    """
+    sizes, _, seeds = _shard_plan(num_paths, seed, shard_paths)
+    if not _use_pool(len(sizes), max_workers):
+        for n, seed_seq in zip(sizes, seeds):
+            yield _map_shard(worker, args, seed_seq, n)
+        return
+    limit = SIMULATOR_WORKERS if max_workers is None else max_workers
+    pool = get_pool()
+    queued = list(zip(sizes, seeds))
+    futures = []
+    try:
+        while queued or futures:
+            while queued and len(futures) < limit:
+                n, seed_seq = queued.pop(0)
+                futures.append(pool.submit(_map_shard, worker, args, seed_seq, n))
+            yield futures.pop(0).result()
+    finally:
+        for future in futures:
+            future.cancel()
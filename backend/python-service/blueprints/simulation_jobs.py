@@ -0,0 +1,181 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .result_cache import estimate_size
+
+# Background jobs for long simulator runs.
+#
+# A JobManager runs submitted functions on a small thread pool (the heavy
+# work itself goes to the simulation process pool or to numpy, which release
+# the GIL) so a request thread only has to enqueue the job. Each Job keeps
+# its latest progress and a version counter that is bumped on every change;
+# pollers read the snapshot, and wait_for_update lets a server-sent events
+# stream block until something new happens. Finished jobs are kept for
+# JOB_TTL seconds so their results can still be fetched, but at most
+# SIMULATOR_MAX_FINISHED_JOBS of them holding SIMULATOR_FINISHED_JOBS_MB of
+# results; beyond that the oldest finished jobs are dropped first.
+
+SIMULATOR_JOB_WORKERS = int(os.environ.get('SIMULATOR_JOB_WORKERS', 2))
+SIMULATOR_MAX_PENDING_JOBS = int(os.environ.get('SIMULATOR_MAX_PENDING_JOBS', 16))
+JOB_TTL = int(os.environ.get('SIMULATOR_JOB_TTL', 3600))
+SIMULATOR_MAX_FINISHED_JOBS = int(os.environ.get('SIMULATOR_MAX_FINISHED_JOBS', 64))
+SIMULATOR_FINISHED_JOBS_MB = int(os.environ.get('SIMULATOR_FINISHED_JOBS_MB', 256))
+
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'queued'
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.client_error = False
+        self.created = time.time()
+        self.finished = None
+        self.result_bytes = 0
+        self.version = 0
+        self.future = None
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in FINISHED_STATES
+
+    def _update(self, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            if self.done and self.finished is None:
+                self.finished = time.time()
+            self.version += 1
+            self._changed.notify_all()
+
+    def report(self, progress):
+        # Progress callback handed to the job function; raising here is how
+        # a running job notices it was cancelled.
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self._update(progress=progress)
+
+    def wait_for_update(self, version, timeout):
+        # Block until the job's version passes version or timeout elapses.
+        with self._changed:
+            self._changed.wait_for(lambda: self.version > version, timeout)
+            return self.version
+
+    def snapshot(self):
+        with self._changed:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'progress': self.progress,
+                'error': self.error,
+                'created': self.created,
+                'finished': self.finished,
+            }
+
+
+class JobManager:
+    def __init__(self, max_workers=SIMULATOR_JOB_WORKERS, max_pending=SIMULATOR_MAX_PENDING_JOBS, ttl=JOB_TTL,
+                 max_finished=SIMULATOR_MAX_FINISHED_JOBS, max_finished_bytes=SIMULATOR_FINISHED_JOBS_MB * 1024 * 1024):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.max_finished = max_finished
+        self.max_finished_bytes = max_finished_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='simulation-job')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn):
+        """Queue fn(report) and return its Job.
+
+        fn is called with the job's progress callback and its return value
+        becomes the job result. Raises QueueFull when max_pending jobs are
+        already queued or running.
+        """
+        with self._lock:
+            self._prune()
+            active = sum(not job.done for job in self._jobs.values())
+            if active >= self.max_pending:
+                raise QueueFull(f"Too many simulation jobs in progress ({active}).")
+            job = Job(uuid.uuid4().hex)
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        if job._cancel.is_set():
+            job._update(status='cancelled')
+            return
+        job._update(status='running')
+        try:
+            result = fn(job.report)
+        except JobCancelled:
+            job._update(status='cancelled')
+        except Exception as e:
+            print(f"Simulation job {job.id} failed: {e}")
+            job._update(status='failed', error=str(e), client_error=isinstance(e, ValueError))
+        else:
+            job._update(status='done', result=result, result_bytes=estimate_size(result))
+        with self._lock:
+            self._prune()
+
+    def get(self, job_id):
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        # Queued jobs are dropped at once; running ones stop at their next
+        # progress report.
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        job._cancel.set()
+        if job.future.cancel():
+            job._update(status='cancelled')
+        return job
+
+    def _prune(self):
+        # Drop expired finished jobs, then the oldest finished ones until the
+        # count and result-size limits hold. Active jobs are never dropped,
+        # and neither is the newest finished one for being too large, so a
+        # single oversized result can still be fetched once.
+        cutoff = time.time() - self.ttl
+        finished = sorted((job for job in self._jobs.values() if job.done), key=lambda job: job.finished)
+        total_bytes = sum(job.result_bytes for job in finished)
+        for i, job in enumerate(finished):
+            remaining = len(finished) - i
+            if (job.finished >= cutoff and remaining <= self.max_finished
+                    and (total_bytes <= self.max_finished_bytes or remaining == 1)):
+                break
+            del self._jobs[job.id]
+            total_bytes -= job.result_bytes
+
+    def stats(self):
+        with self._lock:
+            self._prune()
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                'jobs': counts,
+                'max_pending': self.max_pending,
+                'finished_result_bytes': sum(job.result_bytes for job in self._jobs.values() if job.done),
+                'max_finished': self.max_finished,
+                'max_finished_bytes': self.max_finished_bytes,
+            }
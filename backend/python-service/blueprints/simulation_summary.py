@@ -0,0 +1,279 @@
+import math
+import numpy as np
+
+# Streaming, mergeable summaries of simulated balance paths.
+#
+# A StreamingSummary consumes (paths x years) chunks as they are produced and
+# keeps only fixed-size state: per-year running moments, per-year quantile
+# sketches and running moments of the per-path metrics. Summaries of
+# different shards merge exactly (counts add, moments combine with Chan's
+# formula), so memory stays bounded whatever the number of paths and shards
+# can be summarized where they are simulated.
+#
+# Quantiles come from a log-bucketed sketch (DDSketch): a value x > 0 falls in
+# bucket ceil(log_gamma(x)) and is reported as the bucket's midpoint, which is
+# within relative_accuracy of every value in the bucket. Non-positive values
+# go to a zero bucket or a mirrored negative store.
+
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def as_float(values):
+    # float32 arrays as they are, anything else as float64.
+    values = np.asarray(values)
+    if values.dtype != np.float32:
+        values = values.astype(np.float64, copy=False)
+    return values
+
+
+def path_metrics(paths, initial_amount, years):
+    """Per-path risk metrics of (paths x years) balances in one pass.
+
+    Returns arrays of length paths:
+      max_drawdown     largest fall from a running peak, as a fraction
+      time_under_water years spent below the running peak
+      recovery_time    years from the max-drawdown trough until the path is
+                       back at its prior peak (NaN if it never recovers)
+      annual_return    annualized return over the whole horizon
+      ruined           whether the balance was ever depleted
+
+    float32 paths are kept in float32 rather than copied to float64.
+    """
+    paths = as_float(paths)
+    running_max = np.maximum.accumulate(paths, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = np.nan_to_num((running_max - paths) / running_max)
+        annual_return = (paths[:, -1] / initial_amount) ** (1 / years) - 1
+    rows = np.arange(len(paths))
+    trough = np.argmax(drawdowns, axis=1)
+    max_drawdown = drawdowns[rows, trough]
+    prior_peak = running_max[rows, trough]
+    recovered = (np.arange(paths.shape[1]) > trough[:, None]) & (paths >= prior_peak[:, None])
+    recovery_time = np.where(recovered.any(axis=1), np.argmax(recovered, axis=1) - trough, np.nan)
+    recovery_time[max_drawdown == 0] = 0.0
+    return {
+        'max_drawdown': max_drawdown,
+        'time_under_water': (drawdowns > 0).sum(axis=1).astype(float),
+        'recovery_time': recovery_time,
+        'annual_return': annual_return,
+        'ruined': (paths <= 0).any(axis=1),
+    }
+
+
+class RunningMoments:
+    # Count, mean and sum of squared deviations per column.
+
+    def __init__(self, n_columns):
+        self.count = 0
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+
+    def update(self, values):
+        # float32 values stay float32; the sums are accumulated in float64.
+        values = as_float(values)
+        if not len(values):
+            return
+        values = values.reshape(len(values), -1)
+        other = RunningMoments(values.shape[1])
+        other.count = len(values)
+        other.mean = values.mean(axis=0, dtype=np.float64)
+        deviations = values - other.mean.astype(values.dtype)
+        np.square(deviations, out=deviations)
+        other.m2 = deviations.sum(axis=0, dtype=np.float64)
+        self.merge(other)
+
+    def merge(self, other):
+        if not other.count:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / total)
+        self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / total)
+        self.count = total
+
+    @property
+    def variance(self):
+        # Population variance, like np.std's default.
+        return self.m2 / self.count if self.count else np.zeros_like(self.m2)
+
+
+class _BucketStore:
+    # Counts per (row, key) over a contiguous key range that grows as needed.
+
+    def __init__(self, n_rows):
+        self.n_rows = n_rows
+        self.offset = 0
+        self.counts = np.zeros((n_rows, 0), dtype=np.int64)
+
+    def _extend(self, lo, hi):
+        width = self.counts.shape[1]
+        if width == 0:
+            self.offset = lo
+            self.counts = np.zeros((self.n_rows, hi - lo + 1), dtype=np.int64)
+            return
+        new_lo = min(lo, self.offset)
+        new_hi = max(hi, self.offset + width - 1)
+        if new_lo == self.offset and new_hi == self.offset + width - 1:
+            return
+        counts = np.zeros((self.n_rows, new_hi - new_lo + 1), dtype=np.int64)
+        counts[:, self.offset - new_lo:self.offset - new_lo + width] = self.counts
+        self.offset, self.counts = new_lo, counts
+
+    def add(self, row, keys):
+        if not len(keys):
+            return
+        self._extend(int(keys.min()), int(keys.max()))
+        self.counts[row] += np.bincount(keys - self.offset, minlength=self.counts.shape[1])
+
+    def merge(self, other):
+        if not other.counts.shape[1]:
+            return
+        self._extend(other.offset, other.offset + other.counts.shape[1] - 1)
+        start = other.offset - self.offset
+        self.counts[:, start:start + other.counts.shape[1]] += other.counts
+
+    def keys(self):
+        return np.arange(self.offset, self.offset + self.counts.shape[1])
+
+
+class QuantileSketch:
+    """Mergeable per-column quantile sketch with bounded relative error."""
+
+    def __init__(self, n_columns, relative_accuracy=0.0025, min_value=1e-9):
+        self.n_columns = n_columns
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.positive = _BucketStore(n_columns)
+        self.negative = _BucketStore(n_columns)
+        self.zeros = np.zeros(n_columns, dtype=np.int64)
+        self.count = 0
+
+    def update(self, values):
+        # One column at a time, so the temporaries are a column's size
+        # rather than the chunk's.
+        values = as_float(values).reshape(-1, self.n_columns)
+        for column in range(self.n_columns):
+            col = values[:, column].astype(np.float64)
+            magnitude = np.abs(col)
+            nonzero = magnitude > self.min_value
+            keys = np.ceil(np.log(np.where(nonzero, magnitude, 1.0)) / self.log_gamma).astype(np.int64)
+            positive = nonzero & (col > 0)
+            negative = nonzero & (col < 0)
+            self.positive.add(column, keys[positive])
+            self.negative.add(column, keys[negative])
+            self.zeros[column] += len(col) - np.count_nonzero(nonzero)
+        self.count += values.shape[0]
+
+    def merge(self, other):
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _ordered(self, column):
+        # Bucket values and counts of one column in ascending value order.
+        midpoint = 2.0 / (1 + self.gamma)
+        neg_keys = self.negative.keys()[::-1]
+        pos_keys = self.positive.keys()
+        values = np.concatenate([
+            -midpoint * self.gamma ** neg_keys.astype(float),
+            [0.0],
+            midpoint * self.gamma ** pos_keys.astype(float),
+        ])
+        counts = np.concatenate([
+            self.negative.counts[column, ::-1] if len(neg_keys) else np.zeros(0, dtype=np.int64),
+            [self.zeros[column]],
+            self.positive.counts[column] if len(pos_keys) else np.zeros(0, dtype=np.int64),
+        ])
+        return values, counts
+
+    def quantile(self, q, column):
+        # q in [0, 1]; the bucket holding rank q * (n - 1), as np.percentile does.
+        values, counts = self._ordered(column)
+        rank = q * (self.count - 1)
+        i = int(np.searchsorted(np.cumsum(counts), rank, side='right'))
+        return float(values[min(i, len(values) - 1)])
+
+    def lower_tail_mean(self, q, column):
+        # Mean of the values at or below the q-quantile (CVaR-style).
+        values, counts = self._ordered(column)
+        cumulative = np.cumsum(counts)
+        i = min(int(np.searchsorted(cumulative, q * (self.count - 1), side='right')), len(values) - 1)
+        tail_counts = counts[:i + 1]
+        return float(tail_counts @ values[:i + 1] / tail_counts.sum())
+
+
+class StreamingSummary:
+    """Incremental equivalent of simulator.make_results_summary.
+
+    update(chunk) takes (paths x years) balances; merge(other) combines
+    summaries of disjoint path sets; result() builds the same response dict
+    as the exact summary, with quantiles from the sketches.
+    """
+
+    def __init__(self, years, initial_amount, risk_free_rate=0.03, relative_accuracy=0.0025):
+        self.years = years
+        self.initial_amount = initial_amount
+        self.risk_free_rate = risk_free_rate
+        self.moments = RunningMoments(years)
+        self.sketch = QuantileSketch(years, relative_accuracy)
+        self.max_drawdown = RunningMoments(1)
+        self.annual_return = RunningMoments(1)
+        self.time_under_water = RunningMoments(1)
+        self.recovery_time = RunningMoments(1)
+        self.ruined = 0
+
+    def update(self, chunk):
+        # chunk keeps its dtype: a float32 shard is not copied to float64.
+        chunk = as_float(chunk)
+        self.moments.update(chunk)
+        self.sketch.update(chunk)
+        metrics = path_metrics(chunk, self.initial_amount, self.years)
+        self.max_drawdown.update(metrics['max_drawdown'])
+        self.annual_return.update(metrics['annual_return'])
+        self.time_under_water.update(metrics['time_under_water'])
+        recovery = metrics['recovery_time']
+        self.recovery_time.update(recovery[~np.isnan(recovery)])
+        self.ruined += int(metrics['ruined'].sum())
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        self.max_drawdown.merge(other.max_drawdown)
+        self.annual_return.merge(other.annual_return)
+        self.time_under_water.merge(other.time_under_water)
+        self.recovery_time.merge(other.recovery_time)
+        self.ruined += other.ruined
+
+    def result(self):
+        last = self.years - 1
+        var_5 = self.sketch.quantile(0.05, last)
+        avg_annual_return = float(self.annual_return.mean[0])
+        std_annual_return = float(np.sqrt(self.annual_return.variance[0]))
+        sharpe_ratio = ((avg_annual_return - self.risk_free_rate) / std_annual_return
+                        if std_annual_return != 0 else None)
+        metrics = {
+            'mean_final': float(self.moments.mean[last]),
+            'median_final': self.sketch.quantile(0.5, last),
+            'std_final': float(np.sqrt(self.moments.variance[last])),
+            'avg_max_drawdown': float(self.max_drawdown.mean[0]),
+            'VaR_5': var_5,
+            'CVaR_5': self.sketch.lower_tail_mean(0.05, last),
+            'avg_annual_return': avg_annual_return,
+            'std_annual_return': std_annual_return,
+            'sharpe_ratio': sharpe_ratio,
+            'avg_time_under_water': float(self.time_under_water.mean[0]),
+            'avg_recovery_time': float(self.recovery_time.mean[0]) if self.recovery_time.count else None,
+            'probability_of_ruin': self.ruined / self.moments.count if self.moments.count else 0.0
+        }
+        summary = {
+            'percentiles': {},
+            'expected': self.moments.mean.tolist(),
+            'std_dev': np.sqrt(self.moments.variance).tolist(),
+            'performance_metrics': metrics
+        }
+        for p in PERCENTILES:
+            summary['percentiles'][f'p{p}'] = [self.sketch.quantile(p / 100, y) for y in range(self.years)]
+        return summary
@@ -0,0 +1,7 @@
+# Modules the simulation pool's workers import up front.
+#
+# The pool passes this module to importlib.import_module as its worker
+# initializer, so every worker has the engine and the simulator's shard
+# functions loaded before it takes its first task.
+from . import simulation_engine  # noqa: F401
+from . import simulator  # noqa: F401
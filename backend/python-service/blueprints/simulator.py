@@ -1,53 +1,75 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 import json
 import numpy as np
 import traceback
 import os
 import pandas as pd
 import copy
-from scipy.stats import lognorm, norm
-from arch import arch_model  # External library for GARCH models
+import hashlib
+from statistics import NormalDist
+from . import market_data
+from . import backtest_engine
+from . import simulation_engine
+from . import simulation_summary
+from .simulation_jobs import JobManager, QueueFull
+from .result_cache import LRUCache, DiskCache, TieredCache
 
 simulator_bp = Blueprint('simulator', __name__)
 
+# Responses are cached by content: the key hashes the normalized parameters,
+# the scenario list and (for historical runs) the market data version, so a
+# reload can never serve stale paths. Seeded runs are deterministic, which is
+# what makes their responses cacheable. Set SIMULATOR_CACHE_DIR to keep a
+# persistent tier on disk as well.
+SIMULATION_CACHE_VERSION = 6
+simulation_cache = TieredCache(
+    LRUCache(max_bytes=int(os.environ.get('SIMULATOR_CACHE_MB', 128)) * 1024 * 1024, name='simulator'),
+    DiskCache(os.environ['SIMULATOR_CACHE_DIR'],
+              max_bytes=int(os.environ.get('SIMULATOR_CACHE_DISK_MB', 1024)) * 1024 * 1024,
+              name='simulator_disk') if os.environ.get('SIMULATOR_CACHE_DIR') else None)
+
+# Heavy requests can be submitted as background jobs instead (see the
+# /simulator/jobs routes) so they never hold a request thread.
+simulation_jobs = JobManager()
+
 # -------------------- Helper Functions --------------------
-def apply_cashflow(balance, year, params):
+CASHFLOW_FREQUENCIES = {'monthly': 12, 'quarterly': 4, 'annually': 1}
+
+def build_cashflow_schedule(params):
+    # Per-year signed fixed amounts and withdrawal rates for the whole
+    # horizon, applied to every path's balance at each year end. None when
+    # the request has no cashflows.
+    years = params['investment_years']
     cashflow_type = params.get('cashflow_type', 'none')
     inflation_adjusted = params.get('inflation_adjusted', False)
     inflation_rate = params.get('inflation_rate', 0.02)
-    
-    if cashflow_type == 'withdraw_fixed':
-        amount = params.get('withdrawal_amount', 0.0)
-        freq = params.get('withdrawal_frequency', 'annually').lower()
-        freq_mapping = {'monthly': 12, 'quarterly': 4, 'annually': 1}
-        multiplier = freq_mapping.get(freq, 1)
-        if inflation_adjusted:
-            amount = amount * ((1 + inflation_rate) ** year)
-        total_cashflow = amount * multiplier
-        balance -= total_cashflow
-
-    elif cashflow_type == 'contribute_fixed':
-        amount = params.get('contribution_amount', 0.0)
-        freq = params.get('contribution_frequency', 'annually').lower()
-        freq_mapping = {'monthly': 12, 'quarterly': 4, 'annually': 1}
-        multiplier = freq_mapping.get(freq, 1)
+    amounts = np.zeros(years)
+    rates = np.zeros(years)
+
+    if cashflow_type in ('withdraw_fixed', 'contribute_fixed'):
+        if cashflow_type == 'withdraw_fixed':
+            amount = -params.get('withdrawal_amount', 0.0)
+            freq = params.get('withdrawal_frequency', 'annually').lower()
+        else:
+            amount = params.get('contribution_amount', 0.0)
+            freq = params.get('contribution_frequency', 'annually').lower()
+        amounts[:] = amount * CASHFLOW_FREQUENCIES.get(freq, 1)
         if inflation_adjusted:
-            amount = amount * ((1 + inflation_rate) ** year)
-        total_cashflow = amount * multiplier
-        balance += total_cashflow
+            amounts *= (1 + inflation_rate) ** np.arange(1, years + 1)
 
     elif cashflow_type == 'withdraw_percentage':
         annual_pct = params.get('cashflow_amount', 0.0) / 100.0
         freq = params.get('withdrawal_frequency', 'annually').lower()
-        freq_mapping = {'monthly': 12, 'quarterly': 4, 'annually': 1}
-        n = freq_mapping.get(freq, 1)
+        n = CASHFLOW_FREQUENCIES.get(freq, 1)
         if n == 1:
             effective_rate = annual_pct
         else:
             effective_rate = 1 - (1 - annual_pct)**(1/n)
-        balance -= balance * effective_rate
+        rates[:] = effective_rate
 
-    return balance
+    if not amounts.any() and not rates.any():
+        return None
+    return simulation_engine.CashflowSchedule(amounts, rates)
 
 def get_periods_per_year(freq):
     mapping = {
@@ -92,308 +114,449 @@ def adjust_parameters_for_scenario(params, scenario):
     return adjusted
 
 # -------------------- Simulation Functions --------------------
-# --- Statistical Returns: Normal Model (Annual & Periodic) ---
-def run_statistical_simulation_annual_normal(params):
-    np.random.seed(params.get('random_seed', 42))
-    years = params['investment_years']
-    num_simulations = params.get('num_simulations', 500)
-    assets = params['assets']
-    n_assets = len(assets)
-    means = np.array([a.get('mean_return', 0.07) for a in assets])
-    stdevs = np.array([a.get('volatility', 0.15) for a in assets])
+# Each model is split into draw_shocks(n), which draws the next n periods of
+# shocks for all paths, and make_transform(scenario_params), which turns
+# those shocks into one scenario's asset returns. All scenarios of a request
+# are simulated from the same shocks (common random numbers), so the random
+# draws happen once and scenario differences are not blurred by noise.
+
+def asset_values(params, key, default):
+    return np.array([a.get(key, default) for a in params['assets']], dtype=float)
+
+def correlation_factor(params):
     corr_matrix = params.get('correlation_matrix')
     if corr_matrix is None:
-        corr_matrix = np.eye(n_assets)
-    else:
-        corr_matrix = np.array(corr_matrix)
-    cov_matrix = np.diag(stdevs).dot(corr_matrix).dot(np.diag(stdevs))
-    portfolio_values = np.zeros((num_simulations, years))
-    initial_amount = params['initial_amount']
-    for sim in range(num_simulations):
-        balance = initial_amount
-        for y in range(years):
-            annual_returns = np.random.multivariate_normal(means, cov_matrix)
-            total_return = 0.0
-            for idx, asset in enumerate(assets):
-                weight = asset['allocation'] / 100.0
-                total_return += weight * annual_returns[idx]
-            balance *= (1 + total_return)
-            balance = apply_cashflow(balance, y + 1, params)
-            portfolio_values[sim, y] = balance
-    return portfolio_values
-
-def run_statistical_simulation_periodic_normal(params):
-    np.random.seed(params.get('random_seed', 42))
-    years = params['investment_years']
-    periods_per_year = get_periods_per_year(params.get('rebalancing_frequency', 'none'))
-    total_periods = years * periods_per_year
-    num_simulations = params.get('num_simulations', 500)
-    assets = params['assets']
-    initial_amount = params['initial_amount']
-    period_params = []
-    for asset in assets:
-        mean_ann = asset.get('mean_return', 0.07)
-        vol_ann = asset.get('volatility', 0.15)
-        period_mu = mean_ann / periods_per_year
-        period_vol = vol_ann / np.sqrt(periods_per_year)
-        period_params.append((period_mu, period_vol))
-    portfolio_values = np.zeros((num_simulations, years))
-    for sim in range(num_simulations):
-        asset_balances = { asset['ticker']: initial_amount * (asset['allocation'] / 100.0)
-                           for asset in assets }
-        year_counter = 0
-        for period in range(total_periods):
-            for i, asset in enumerate(assets):
-                ticker = asset['ticker']
-                mu_p, vol_p = period_params[i]
-                period_return = norm(mu_p, vol_p).rvs()
-                asset_balances[ticker] *= (1 + period_return)
-            total = sum(asset_balances.values())
-            for asset in assets:
-                ticker = asset['ticker']
-                target = asset['allocation'] / 100.0
-                asset_balances[ticker] = total * target
-            if (period + 1) % periods_per_year == 0:
-                total = sum(asset_balances.values())
-                total = apply_cashflow(total, year_counter + 1, params)
-                for asset in assets:
-                    ticker = asset['ticker']
-                    target = asset['allocation'] / 100.0
-                    asset_balances[ticker] = total * target
-                portfolio_values[sim, year_counter] = total
-                year_counter += 1
-    return portfolio_values
-
-# --- Statistical Returns: GARCH Model using the arch library ---
-def run_statistical_simulation_annual_garch(params):
-    np.random.seed(params.get('random_seed', 42))
-    years = params['investment_years']
-    num_simulations = params.get('num_simulations', 500)
-    assets = params['assets']
-    initial_amount = params['initial_amount']
-    portfolio_values = np.zeros((num_simulations, years))
-    
-    for sim in range(num_simulations):
-        balance = initial_amount
-        asset_returns = {}
-        for asset in assets:
-            mu = asset.get('mean_return', 0.07)
-            vol_init = asset.get('volatility', 0.15)
-            omega = 0.05 * (vol_init ** 2)
-            alpha = 0.1
-            beta = 0.85
-            model = arch_model(None, vol='Garch', p=1, q=1, mean='Constant', dist='normal')
-            sim_data = model.simulate(np.array([mu, omega, alpha, beta]), nobs=years)
-            asset_returns[asset['ticker']] = sim_data['data'].values
-        for y in range(years):
-            yearly_return = 0.0
-            for asset in assets:
-                ticker = asset['ticker']
-                weight = asset['allocation'] / 100.0
-                yearly_return += weight * asset_returns[ticker][y]
-            balance *= (1 + yearly_return)
-            balance = apply_cashflow(balance, y + 1, params)
-            portfolio_values[sim, y] = balance
-    return portfolio_values
-
-def run_statistical_simulation_periodic_garch(params):
-    np.random.seed(params.get('random_seed', 42))
+        return None
+    return simulation_engine.cholesky_factor(np.array(corr_matrix, dtype=float))
+
+# --- Statistical Returns: Normal Model ---
+def normal_sampler(params, rng, num_simulations, dims):
+    # Shock sampler for the request's sampling_mode, one block per year.
+    return simulation_engine.NormalSampler(
+        rng, num_simulations, dims, params['investment_years'],
+        mode=params.get('sampling_mode', 'random'), moment_matching=params.get('moment_matching', False))
+
+def normal_model(params, rng, num_simulations, periods_per_year):
+    # Correlated standard normal shocks, scaled per asset. The correlation
+    # matrix is factorized once per request.
+    n_assets = len(params['assets'])
+    chol = correlation_factor(params)
+    sampler = normal_sampler(params, rng, num_simulations, n_assets)
+
+    def draw_shocks(n):
+        z = sampler(n)
+        return z if chol is None else z @ chol.T
+
+    def make_transform(scenario):
+        mu = asset_values(scenario, 'mean_return', 0.07) / periods_per_year
+        vol = asset_values(scenario, 'volatility', 0.15) / np.sqrt(periods_per_year)
+        return lambda shocks: mu + vol * shocks
+
+    return draw_shocks, make_transform
+
+# --- Statistical Returns: GARCH(1,1) Model ---
+GARCH_ALPHA = 0.1
+GARCH_BETA = 0.85
+
+def garch_model(params, rng, num_simulations, periods_per_year):
+    # Per-asset GARCH(1,1) with omega = 0.05 * vol^2, i.e. an unconditional
+    # variance of vol^2 per year, scaled down to the period length. The
+    # recursion is homogeneous in vol, so the shocks are unit-vol GARCH
+    # innovations and each scenario scales them by its own volatilities.
+    n_assets = len(params['assets'])
+    sampler = None
+    if params.get('sampling_mode', 'random') != 'random' or params.get('moment_matching', False):
+        sampler = normal_sampler(params, rng, num_simulations, n_assets)
+    generator = simulation_engine.GarchPathGenerator(
+        rng, np.zeros(n_assets), np.full(n_assets, 0.05 / periods_per_year), GARCH_ALPHA, GARCH_BETA,
+        num_simulations, chol=correlation_factor(params), sampler=sampler)
+
+    def make_transform(scenario):
+        mu = asset_values(scenario, 'mean_return', 0.07) / periods_per_year
+        vol = asset_values(scenario, 'volatility', 0.15)
+        return lambda shocks: mu + vol * shocks
+
+    return generator.draw, make_transform
+
+# --- Parameterized Model ---
+def parameterized_model(params, rng, num_simulations, periods_per_year, n_assets):
+    draw_shocks = normal_sampler(params, rng, num_simulations, n_assets)
+
+    def make_transform(scenario):
+        mu = scenario.get('mu', 0.05) / periods_per_year
+        sigma = scenario.get('sigma', 0.10) / np.sqrt(periods_per_year)
+        if scenario.get('distribution_type', 'lognormal').lower() == 'lognormal':
+            # lognorm(s, scale=exp(m)) is exp(m + s * z)
+            return lambda shocks: np.expm1(mu + sigma * shocks)
+        return lambda shocks: mu + sigma * shocks
+
+    return draw_shocks, make_transform
+
+# --- Historical Model ---
+def historical_returns_matrix(assets, asset_data):
+    # (months x assets) history shared by all assets; series of different
+    # lengths are aligned on their most recent months.
+    series = [np.asarray(asset_data[a['ticker']], dtype=float) for a in assets]
+    n_months = min(len(arr) for arr in series)
+    return np.column_stack([arr[len(arr) - n_months:] for arr in series])
+
+def historical_model(params, asset_data, rng, num_simulations, periods_per_year):
+    # Joint bootstrap: one (paths x months) index matrix picks the same
+    # historical months for every asset, so their correlation is preserved.
     years = params['investment_years']
+    returns = historical_returns_matrix(params['assets'], asset_data)
+    indices = simulation_engine.bootstrap_indices(
+        rng, returns.shape[0], num_simulations, years * 12,
+        block_length=params.get('block_length', 1), block_type=params.get('block_type', 'fixed'))
+    draw_shocks = simulation_engine.bootstrap_draw(returns, indices, int(12 / periods_per_year))
+
+    def make_transform(scenario):
+        adjustment = scenario.get('historical_adjustment', 0.0)
+        return lambda monthly: simulation_engine.compound_months(monthly, adjustment)
+
+    return draw_shocks, make_transform
+
+# --- Model dispatch and path sharding ---
+SIMULATION_MODELS = ('historical', 'parameterized', 'statistical')
+
+def allocation_weights(params):
+    # (1 x assets) weights of a single-portfolio request.
+    return np.array([[a['allocation'] / 100.0 for a in params['assets']]])
+
+def simulate_scenario_paths(params, scenario_params, weights, asset_data, rng, num_simulations):
+    """(scenarios x portfolios x num_simulations x years) balances.
+
+    params fixes the model, horizon, asset list and cashflows; each entry of
+    scenario_params (adjusted copies of params) supplies its own return
+    parameters, and each row of weights (portfolios x assets) is one
+    allocation over params['assets']. Every portfolio and scenario is driven
+    by the same asset-level shocks.
+    """
+    simulation_model = params['simulation_model']
     periods_per_year = get_periods_per_year(params.get('rebalancing_frequency', 'none'))
-    total_periods = years * periods_per_year
-    num_simulations = params.get('num_simulations', 500)
-    assets = params['assets']
-    initial_amount = params['initial_amount']
-    portfolio_values = np.zeros((num_simulations, years))
-    
-    for sim in range(num_simulations):
-        simulated_returns = {}
-        for asset in assets:
-            mu = asset.get('mean_return', 0.07)
-            vol_init = asset.get('volatility', 0.15)
-            omega = 0.05 * (vol_init ** 2)
-            alpha = 0.1
-            beta = 0.85
-            model = arch_model(None, vol='Garch', p=1, q=1, mean='Constant', dist='normal')
-            sim_data = model.simulate(np.array([mu, omega, alpha, beta]), nobs=total_periods)
-            simulated_returns[asset['ticker']] = sim_data['data'].values
-        
-        asset_balances = { asset['ticker']: initial_amount * (asset['allocation'] / 100.0)
-                           for asset in assets }
-        year_counter = 0
-        for period in range(total_periods):
-            for asset in assets:
-                ticker = asset['ticker']
-                r = simulated_returns[ticker][period]
-                asset_balances[ticker] *= (1 + r)
-            if (period + 1) % periods_per_year == 0:
-                total = sum(asset_balances.values())
-                total = apply_cashflow(total, year_counter + 1, params)
-                for asset in assets:
-                    ticker = asset['ticker']
-                    target = asset['allocation'] / 100.0
-                    asset_balances[ticker] = total * target
-                portfolio_values[sim, year_counter] = total
-                year_counter += 1
-    return portfolio_values
-
-# --- Dispatcher for Statistical Simulation ---
-def run_statistical_simulation(params):
-    time_series_model = params.get('time_series_model', 'normal').lower()
-    rebal_freq = params.get('rebalancing_frequency', 'none').lower()
-    if rebal_freq in ['none', 'annually']:
+    rebalance_every = 1
+
+    if simulation_model == 'historical':
+        draw_shocks, make_transform = historical_model(params, asset_data, rng, num_simulations, periods_per_year)
+    elif simulation_model == 'parameterized':
+        if periods_per_year == 1:
+            # Annual draws are one portfolio-level return per year.
+            weights = np.ones((len(weights), 1))
+        draw_shocks, make_transform = parameterized_model(params, rng, num_simulations, periods_per_year,
+                                                          weights.shape[1])
+    elif simulation_model == 'statistical':
+        time_series_model = params.get('time_series_model', 'normal').lower()
         if time_series_model == 'normal':
-            return run_statistical_simulation_annual_normal(params)
+            draw_shocks, make_transform = normal_model(params, rng, num_simulations, periods_per_year)
         elif time_series_model == 'garch':
-            return run_statistical_simulation_annual_garch(params)
+            draw_shocks, make_transform = garch_model(params, rng, num_simulations, periods_per_year)
+            # Holdings drift within the year and are rebalanced at year end.
+            rebalance_every = periods_per_year
         else:
             raise ValueError("Invalid time_series_model for statistical simulation.")
     else:
-        if time_series_model == 'normal':
-            return run_statistical_simulation_periodic_normal(params)
-        elif time_series_model == 'garch':
-            return run_statistical_simulation_periodic_garch(params)
-        else:
-            raise ValueError("Invalid time_series_model for statistical simulation.")
+        raise ValueError("Invalid simulation model specified.")
 
-# --- Historical & Parameterized Simulation ---
-def run_historical_simulation(params, asset_data):
-    rebal_freq = params.get('rebalancing_frequency', 'none').lower()
-    if rebal_freq in ['none', 'annually']:
-        return run_historical_simulation_annual(params, asset_data)
-    else:
-        return run_historical_simulation_periodic(params, asset_data)
+    return simulation_engine.simulate_scenarios(
+        draw_shocks, [make_transform(scenario) for scenario in scenario_params], weights,
+        params['initial_amount'], params['investment_years'], periods_per_year, num_simulations,
+        cashflow=build_cashflow_schedule(params), rebalance_every=rebalance_every, dtype=path_dtype(params))
 
-def run_historical_simulation_annual(params, asset_data):
-    np.random.seed(params.get('random_seed', 42))
-    years = params['investment_years']
-    num_simulations = params.get('num_simulations', 500)
-    portfolio_values = np.zeros((num_simulations, years))
-    adjustment = params.get('historical_adjustment', 0.0)
-    for sim in range(num_simulations):
-        balance = params['initial_amount']
-        for y in range(years):
-            yearly_return = 0.0
-            for asset in params['assets']:
-                ticker = asset['ticker']
-                weight = asset['allocation'] / 100.0
-                monthly_arr = asset_data.get(ticker, np.random.normal(0.07, 0.05, 120))
-                idx = np.random.randint(0, len(monthly_arr), size=12)
-                adjusted_returns = monthly_arr[idx] + adjustment
-                comp_return = np.prod(1 + adjusted_returns) - 1
-                yearly_return += weight * comp_return
-            balance *= (1 + yearly_return)
-            balance = apply_cashflow(balance, y + 1, params)
-            portfolio_values[sim, y] = balance
-    return portfolio_values
-
-def run_historical_simulation_periodic(params, asset_data):
-    np.random.seed(params.get('random_seed', 42))
+def simulate_model_paths(args, rng, num_paths):
+    # One path shard of every scenario and portfolio, flattened to
+    # (num_paths x scenarios*portfolios*years) for run_sharded; runs in pool
+    # workers too, so it only takes picklable arguments.
+    params, scenario_params, weights, asset_data = args
+    values = simulate_scenario_paths(params, scenario_params, weights, asset_data, rng, num_paths)
+    return np.moveaxis(values, 2, 0).reshape(num_paths, -1)
+
+# -------------------- Memory budget --------------------
+# precision='float32' stores holdings and balances in float32 (shocks are
+# still drawn in float64 and cast per year). memory_budget_mb bounds the
+# paths a request holds at once: the full path matrix is only built for an
+# exact summary when it fits in half the budget (otherwise the summary is
+# streamed), and the rest of the budget sets the shard size and how many
+# shards run at a time. A budgeted run uses smaller shards, so its paths
+# differ from an unbudgeted run with the same seed.
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+
+def path_dtype(params):
+    return PRECISIONS[params.get('precision', 'float64')]
+
+def memory_plan(params, n_scenarios, n_portfolios, n_assets, num_paths=None):
+    """How a request stores its paths: dtype, shard_paths, max_workers,
+    streaming (summary built shard by shard) and estimated_peak_bytes.
+
+    estimated_peak_bytes is computed from array shapes, not measured (see
+    tests/test_simulator_memory.py for the tracemalloc check). It counts
+    the arrays held for the paths: per shard the holdings, balances,
+    flattened output and one year of shocks and returns (plus, for a
+    streaming summary, the per-path metric temporaries of one portfolio's
+    shard, in the path dtype), and for an exact summary the gathered path
+    matrix and its per-portfolio copies.
+    """
+    dtype = path_dtype(params)
+    itemsize = np.dtype(dtype).itemsize
     years = params['investment_years']
-    periods_per_year = get_periods_per_year(params.get('rebalancing_frequency', 'none'))
-    total_periods = years * periods_per_year
-    num_simulations = params.get('num_simulations', 500)
-    months_per_period = int(12 / periods_per_year)
-    assets = params['assets']
-    portfolio_values = np.zeros((num_simulations, years))
-    for sim in range(num_simulations):
-        asset_balances = { asset['ticker']: params['initial_amount'] * (asset['allocation'] / 100.0)
-                           for asset in assets }
-        year_counter = 0
-        for period in range(total_periods):
-            for asset in assets:
-                ticker = asset['ticker']
-                monthly_arr = asset_data.get(ticker, np.random.normal(0.07, 0.05, 120))
-                idx = np.random.randint(0, len(monthly_arr), size=months_per_period)
-                period_return = np.prod(1 + monthly_arr[idx]) - 1
-                asset_balances[ticker] *= (1 + period_return)
-            total = sum(asset_balances.values())
-            for asset in assets:
-                ticker = asset['ticker']
-                target = asset['allocation'] / 100.0
-                asset_balances[ticker] = total * target
-            if (period + 1) % periods_per_year == 0:
-                total = sum(asset_balances.values())
-                total = apply_cashflow(total, year_counter + 1, params)
-                for asset in assets:
-                    ticker = asset['ticker']
-                    target = asset['allocation'] / 100.0
-                    asset_balances[ticker] = total * target
-                portfolio_values[sim, year_counter] = total
-                year_counter += 1
-    return portfolio_values
-
-def run_parameterized_simulation(params):
-    rebal_freq = params.get('rebalancing_frequency', 'none').lower()
-    if rebal_freq in ['none', 'annually']:
-        return run_parameterized_simulation_annual(params)
+    if num_paths is None:
+        num_paths = params.get('num_simulations', 500)
+    cells = n_scenarios * n_portfolios * years
+    # A year of shocks and returns covers at most 12 periods (or bootstrapped
+    # months) per asset; historical runs also keep int32 month indices.
+    per_path = (itemsize * (n_scenarios * n_portfolios * n_assets + 2 * cells)
+                + 8 * 3 * 12 * n_assets + 4 * 12 * years)
+    exact_bytes = num_paths * (2 * cells * itemsize + years * (3 * itemsize + 1))
+    # A streaming summary also holds path_metrics' temporaries for one
+    # portfolio's shard: four arrays of the path dtype and two masks.
+    streaming_per_path = per_path + (4 * itemsize + 2) * years
+    budget = params.get('memory_budget_mb')
+
+    if budget is None:
+        streaming = use_streaming_summary(params)
+        shard_paths = simulation_engine.SHARD_PATHS
+        max_workers = None
     else:
-        return run_parameterized_simulation_periodic(params)
+        budget_bytes = budget * 1024 * 1024
+        mode = params.get('summary_mode', 'auto')
+        if mode == 'exact' and exact_bytes >= budget_bytes:
+            raise ValueError("An exact summary of these paths does not fit in memory_budget_mb; "
+                             "use summary_mode 'streaming' or a larger budget.")
+        streaming = mode == 'streaming' or (mode == 'auto' and exact_bytes > budget_bytes / 2)
+        remaining = budget_bytes - (0 if streaming else exact_bytes)
+        shard_bytes = streaming_per_path if streaming else per_path
+        if remaining < shard_bytes:
+            raise ValueError("memory_budget_mb is too small to simulate a single path.")
+        shard_paths = int(min(simulation_engine.SHARD_PATHS, remaining // shard_bytes))
+        max_workers = int(max(1, min(simulation_engine.SIMULATOR_WORKERS, remaining // (shard_paths * shard_bytes))))
+
+    if params.get('sampling_mode') == 'sobol':
+        # Each shard is its own Sobol sample, balanced only at powers of two.
+        shard_paths = simulation_engine.power_of_two_below(shard_paths)
+    if streaming:
+        per_path = streaming_per_path
+    n_shards = len(simulation_engine.shard_sizes(num_paths, shard_paths))
+    workers = simulation_engine.SIMULATOR_WORKERS if max_workers is None else max_workers
+    in_flight = min(n_shards, workers) if simulation_engine._use_pool(n_shards, max_workers) else 1
+    return {
+        'dtype': dtype,
+        'num_paths': num_paths,
+        'shard_paths': shard_paths,
+        'max_workers': max_workers,
+        'streaming': streaming,
+        'concurrent_shards': in_flight,
+        'exact_bytes_per_path': exact_bytes // max(num_paths, 1),
+        'estimated_peak_bytes': int(in_flight * min(shard_paths, num_paths) * per_path
+                                    + (0 if streaming else exact_bytes)),
+    }
+
+def request_memory_plan(params, scenario_params, weights, num_paths=None):
+    return memory_plan(params, len(scenario_params), len(weights), np.atleast_2d(weights).shape[1], num_paths)
 
-def run_parameterized_simulation_annual(params):
-    np.random.seed(params.get('random_seed', 42))
+def adaptive_memory_plan(params, scenario_params, weights):
+    # Adaptive runs keep every path for their exact summary, so under a
+    # budget max_simulations is lowered until the path matrix fits in half
+    # of it; the plan is made for that many paths.
+    num_paths = params['max_simulations']
+    if params.get('memory_budget_mb') is not None:
+        per_path = request_memory_plan(params, scenario_params, weights, num_paths=1)['exact_bytes_per_path']
+        num_paths = max(2, min(num_paths, int(params['memory_budget_mb'] * 1024 * 1024 / 2 // per_path)))
+    return request_memory_plan(dict(params, summary_mode='exact'), scenario_params, weights, num_paths)
+
+def final_percentiles(finals):
+    # Percentiles of (paths x scenarios x portfolios) final balances, as
+    # [s][p] dicts keyed like the response's percentiles.
+    values = np.percentile(finals, simulation_summary.PERCENTILES, axis=0)
+    return [[{f'p{q}': float(values[i, s, p]) for i, q in enumerate(simulation_summary.PERCENTILES)}
+             for p in range(finals.shape[2])] for s in range(finals.shape[1])]
+
+def run_scenarios(params, scenario_params, asset_data=None, weights=None, progress=None, plan=None):
+    """results[s][p] is the (num_simulations x years) array of scenario s and
+    portfolio p; identical for a given random_seed whatever the number of
+    workers. weights defaults to the request's single allocation.
+    progress(paths_done, partial) is called as shards finish, with partial
+    the final-balance percentiles of the paths so far. plan (memory_plan)
+    sets the shard size and dtype."""
+    if weights is None:
+        weights = allocation_weights(params)
+    if plan is None:
+        plan = request_memory_plan(params, scenario_params, weights)
     years = params['investment_years']
-    num_simulations = params.get('num_simulations', 500)
-    portfolio_values = np.zeros((num_simulations, years))
-    mu = params.get('mu', 0.05)
-    sigma = params.get('sigma', 0.10)
-    initial_amount = params['initial_amount']
-    dist_type = params.get('distribution_type', 'lognormal').lower()
-    for sim in range(num_simulations):
-        balance = initial_amount
-        for y in range(years):
-            if dist_type == 'lognormal':
-                r = lognorm(sigma, scale=np.exp(mu)).rvs()
-                annual_return = r - 1
-            else:
-                annual_return = norm(mu, sigma).rvs()
-            balance *= (1 + annual_return)
-            balance = apply_cashflow(balance, y + 1, params)
-            portfolio_values[sim, y] = balance
-    return portfolio_values
-
-def run_parameterized_simulation_periodic(params):
-    np.random.seed(params.get('random_seed', 42))
+    n_portfolios = len(weights)
+    on_shard = None
+    if progress is not None:
+        finals = []
+
+        def on_shard(rows):
+            finals.append(rows.reshape(len(rows), len(scenario_params), n_portfolios, years)[..., -1].copy())
+            done = np.concatenate(finals)
+            progress(len(done), final_percentiles(done))
+
+    flat = simulation_engine.run_sharded(
+        simulate_model_paths, (params, scenario_params, weights, asset_data), params.get('num_simulations', 500),
+        len(scenario_params) * n_portfolios * years, params.get('random_seed', 42),
+        max_workers=plan['max_workers'], on_shard=on_shard, shard_paths=plan['shard_paths'], dtype=plan['dtype'])
+    values = flat.reshape(len(flat), len(scenario_params), n_portfolios, years)
+    return [[np.ascontiguousarray(values[:, s, p]) for p in range(n_portfolios)]
+            for s in range(len(scenario_params))]
+
+# Above this many (path, year) cells the summary is built from streaming
+# sketches instead of the full path matrix (~80 MB of float64).
+STREAMING_MIN_CELLS = 10_000_000
+
+def summarize_model_paths(args, rng, num_paths):
+    # One shard reduced to a mergeable summary per scenario and portfolio;
+    # its paths are dropped here.
+    params, scenario_params, weights, asset_data = args
+    values = simulate_scenario_paths(params, scenario_params, weights, asset_data, rng, num_paths)
+    summaries = []
+    for scenario_values in values:
+        scenario_summaries = []
+        for portfolio_values in scenario_values:
+            summary = simulation_summary.StreamingSummary(
+                params['investment_years'], params['initial_amount'],
+                params.get('base_interest_rate', 3.0) / 100.0)
+            summary.update(portfolio_values)
+            scenario_summaries.append(summary)
+        summaries.append(scenario_summaries)
+    return summaries
+
+def use_streaming_summary(params):
+    mode = params.get('summary_mode', 'auto')
+    if mode == 'auto':
+        return params.get('num_simulations', 500) * params['investment_years'] >= STREAMING_MIN_CELLS
+    return mode == 'streaming'
+
+def simulate_summaries(params, scenario_params, asset_data=None, weights=None, progress=None, plan=None):
+    # summaries[s][p]: response summary of scenario s and portfolio p, either
+    # exact over the full path matrices or merged shard by shard with
+    # bounded memory, as the memory plan decides. progress is passed the
+    # paths done after every shard, as in run_scenarios.
+    if weights is None:
+        weights = allocation_weights(params)
+    if not scenario_params or not len(weights):
+        return [[] for _ in scenario_params]
+    if plan is None:
+        plan = request_memory_plan(params, scenario_params, weights)
+    if not plan['streaming']:
+        return [[make_results_summary(results, params) for results in scenario_results]
+                for scenario_results in run_scenarios(params, scenario_params, asset_data, weights, progress, plan)]
+    summaries = None
+    last = params['investment_years'] - 1
+    for shard_summaries in simulation_engine.map_shards(
+            summarize_model_paths, (params, scenario_params, weights, asset_data),
+            params.get('num_simulations', 500), params.get('random_seed', 42),
+            max_workers=plan['max_workers'], shard_paths=plan['shard_paths']):
+        if summaries is None:
+            summaries = shard_summaries
+        else:
+            for scenario_summaries, shard_scenario in zip(summaries, shard_summaries):
+                for summary, shard_summary in zip(scenario_summaries, shard_scenario):
+                    summary.merge(shard_summary)
+        if progress is not None:
+            progress(summaries[0][0].moments.count, [[
+                {f'p{q}': summary.sketch.quantile(q / 100, last) for q in simulation_summary.PERCENTILES}
+                for summary in scenario_summaries] for scenario_summaries in summaries])
+    return [[summary.result() for summary in scenario_summaries] for scenario_summaries in summaries]
+
+# -------------------- Adaptive path count --------------------
+# With convergence_tolerance set, paths are simulated in batches until the
+# confidence intervals of every reported percentile, VaR_5 and CVaR_5 are
+# narrower than the tolerance, or max_simulations is reached. Half-widths are
+# relative to the estimate, but never to less than initial_amount: with
+# withdrawals a percentile that reaches depletion has an estimate near zero,
+# and a ratio against it would never shrink. Each batch draws from its own child of
+# SeedSequence(random_seed), so a seed still fixes the result.
+
+def quantile_ci_precision(values, q, z, floor):
+    # Largest relative half-width over the columns of (paths x columns)
+    # values of the distribution-free CI of the q-quantile, whose bounds are
+    # the order statistics n*q -/+ z*sqrt(n*q*(1-q)).
+    n = len(values)
+    spread = z * np.sqrt(n * q * (1 - q))
+    ranks = np.clip([np.floor(n * q - spread), q * (n - 1), np.ceil(n * q + spread)], 0, n - 1)
+    lo, estimate, hi = np.quantile(values, ranks / max(n - 1, 1), axis=0, method='nearest')
+    return float(np.max((hi - lo) / 2 / np.maximum(np.abs(estimate), floor)))
+
+def cvar_precision(final_values, q, z, floor):
+    # Relative CI half-width of the lower-tail mean at level q, from the
+    # asymptotic variance Var(min(X - VaR, 0)) / (q^2 n) of the estimator.
+    n = len(final_values)
+    var = np.percentile(final_values, q * 100, axis=0)
+    cvar = np.array([col[col <= v].mean() for col, v in zip(final_values.T, var)])
+    se = np.std(np.minimum(final_values - var, 0), axis=0) / (q * np.sqrt(n))
+    return float(np.max(z * se / np.maximum(np.abs(cvar), floor)))
+
+def convergence_precision(values, params):
+    """Relative CI half-widths of the reported statistics of
+    (paths x scenarios x portfolios x years) balances, the worst case over
+    scenarios, portfolios and years."""
+    z = NormalDist().inv_cdf(0.5 + params['confidence_level'] / 2)
+    floor = params['initial_amount']
+    cells = values.reshape(len(values), -1)
+    final_values = values[..., -1].reshape(len(values), -1)
+    return {
+        'percentiles': max(quantile_ci_precision(cells, p / 100, z, floor)
+                           for p in simulation_summary.PERCENTILES),
+        'VaR_5': quantile_ci_precision(final_values, 0.05, z, floor),
+        'CVaR_5': cvar_precision(final_values, 0.05, z, floor),
+    }
+
+def simulate_adaptive(params, scenario_params, asset_data=None, weights=None, progress=None, plan=None):
+    """(summaries[s][p], convergence) with the path count chosen by
+    convergence_tolerance as described above.
+
+    After each batch the paths still needed are extrapolated from the
+    1/sqrt(n) shrinkage of the widest CI; the next batch is at least
+    min_simulations and at most doubles the paths so far. Under a memory
+    budget the path budget is capped as in adaptive_memory_plan. With Sobol
+    sampling every batch is rounded down to a power of two.
+    """
+    if weights is None:
+        weights = allocation_weights(params)
+    if not scenario_params or not len(weights):
+        return [[] for _ in scenario_params], None
+    if plan is None:
+        plan = adaptive_memory_plan(params, scenario_params, weights)
     years = params['investment_years']
-    periods_per_year = get_periods_per_year(params.get('rebalancing_frequency', 'none'))
-    total_periods = years * periods_per_year
-    num_simulations = params.get('num_simulations', 500)
-    initial_amount = params['initial_amount']
-    mu = params.get('mu', 0.05)
-    sigma = params.get('sigma', 0.10)
-    dist_type = params.get('distribution_type', 'lognormal').lower()
-    period_mu = mu / periods_per_year
-    period_sigma = sigma / np.sqrt(periods_per_year)
-    assets = params['assets']
-    portfolio_values = np.zeros((num_simulations, years))
-    for sim in range(num_simulations):
-        asset_balances = { asset['ticker']: initial_amount * (asset['allocation'] / 100.0)
-                           for asset in assets }
-        year_counter = 0
-        for period in range(total_periods):
-            for asset in assets:
-                ticker = asset['ticker']
-                if dist_type == 'lognormal':
-                    r = lognorm(period_sigma, scale=np.exp(period_mu)).rvs()
-                    period_return = r - 1
-                else:
-                    period_return = norm(period_mu, period_sigma).rvs()
-                asset_balances[ticker] *= (1 + period_return)
-            total = sum(asset_balances.values())
-            for asset in assets:
-                ticker = asset['ticker']
-                target = asset['allocation'] / 100.0
-                asset_balances[ticker] = total * target
-            if (period + 1) % periods_per_year == 0:
-                total = sum(asset_balances.values())
-                total = apply_cashflow(total, year_counter + 1, params)
-                for asset in assets:
-                    ticker = asset['ticker']
-                    target = asset['allocation'] / 100.0
-                    asset_balances[ticker] = total * target
-                portfolio_values[sim, year_counter] = total
-                year_counter += 1
-    return portfolio_values
+    n_scenarios, n_portfolios = len(scenario_params), len(weights)
+    tolerance = params['convergence_tolerance']
+    budget = plan['num_paths']
+    root_seed = np.random.SeedSequence(params.get('random_seed', 42))
+    args = (params, scenario_params, weights, asset_data)
+    batches = []
+    sobol = params.get('sampling_mode') == 'sobol'
+    n_paths, batch = 0, min(params['min_simulations'], budget)
+    while True:
+        if sobol:
+            batch = simulation_engine.power_of_two_below(batch)
+        flat = simulation_engine.run_sharded(simulate_model_paths, args, batch,
+                                             n_scenarios * n_portfolios * years, root_seed.spawn(1)[0],
+                                             max_workers=plan['max_workers'], shard_paths=plan['shard_paths'],
+                                             dtype=plan['dtype'])
+        batches.append(flat.reshape(batch, n_scenarios, n_portfolios, years))
+        values = np.concatenate(batches) if len(batches) > 1 else batches[0]
+        batches = [values]
+        n_paths += batch
+        precision = convergence_precision(values, params)
+        worst = max(precision.values())
+        if progress is not None:
+            progress(n_paths, final_percentiles(values[..., -1]))
+        if worst <= tolerance or n_paths >= budget:
+            break
+        needed = int(np.ceil(n_paths * (worst / tolerance) ** 2 * 1.1)) - n_paths
+        batch = int(min(max(needed, params['min_simulations']), n_paths, budget - n_paths))
+
+    summaries = [[make_results_summary(np.ascontiguousarray(values[:, s, p]), params)
+                  for p in range(n_portfolios)] for s in range(n_scenarios)]
+    convergence = {
+        'converged': worst <= tolerance,
+        'paths_used': n_paths,
+        'tolerance': tolerance,
+        'confidence_level': params['confidence_level'],
+        'precision': worst,
+        'precision_by_metric': precision,
+    }
+    return summaries, convergence
 
 def build_simulation_params(features):
     simulation_model = features.get('simulation_model', 'historical').lower()
@@ -423,14 +586,49 @@ def build_simulation_params(features):
         'simulation_model': features.get('simulation_model', 'historical').lower(),
         'base_interest_rate': float(features.get('base_interest_rate', 3.0)),
         'rebalancing_frequency': features.get('rebalancing_frequency', 'none'),
-        'num_simulations': int(features.get('num_simulations', 500))
+        'num_simulations': int(features.get('num_simulations', 500)),
+        'block_length': int(features.get('block_length', 1)),
+        'block_type': features.get('block_type', 'fixed').lower(),
+        'summary_mode': features.get('summary_mode', 'auto').lower(),
+        'sampling_mode': features.get('sampling_mode', 'random').lower(),
+        'moment_matching': bool(features.get('moment_matching', False)),
+        'precision': str(features.get('precision', 'float64')).lower(),
+        'memory_budget_mb': (float(features['memory_budget_mb'])
+                             if features.get('memory_budget_mb') is not None else None),
+        'convergence_tolerance': float(features.get('convergence_tolerance', 0.0)),
+        'confidence_level': float(features.get('confidence_level', 0.95)),
+        'min_simulations': int(features.get('min_simulations', 1000)),
+        'max_simulations': int(features.get('max_simulations', 100000))
     }
     if features.get('cashflow_type', 'none') == 'withdraw_percentage':
         pct = float(features.get('cashflow_amount', 0.0))
         if pct > 100:
             raise ValueError("Withdrawal Percentage cannot exceed 100%.")
+    if params['block_type'] not in ('fixed', 'stationary'):
+        raise ValueError("block_type must be 'fixed' or 'stationary'.")
+    if params['summary_mode'] not in ('auto', 'exact', 'streaming'):
+        raise ValueError("summary_mode must be 'auto', 'exact' or 'streaming'.")
+    if params['sampling_mode'] not in simulation_engine.SAMPLING_MODES:
+        raise ValueError(f"sampling_mode must be one of {', '.join(simulation_engine.SAMPLING_MODES)}.")
+    if simulation_model == 'historical' and (params['sampling_mode'] != 'random' or params['moment_matching']):
+        raise ValueError("sampling_mode and moment_matching do not apply to the historical bootstrap.")
+    if params['sampling_mode'] == 'sobol':
+        # Sobol samples are only balanced at powers of two.
+        params['num_simulations'] = simulation_engine.sobol_path_count(params['num_simulations'])
+    if params['precision'] not in PRECISIONS:
+        raise ValueError("precision must be 'float64' or 'float32'.")
+    if params['memory_budget_mb'] is not None and params['memory_budget_mb'] <= 0:
+        raise ValueError("memory_budget_mb must be positive.")
+    if params['convergence_tolerance'] < 0:
+        raise ValueError("convergence_tolerance cannot be negative.")
+    if not 0 < params['confidence_level'] < 1:
+        raise ValueError("confidence_level must be between 0 and 1.")
+    if not 2 <= params['min_simulations'] <= params['max_simulations']:
+        raise ValueError("min_simulations must be at least 2 and at most max_simulations.")
     if params['simulation_model'] == 'statistical':
         params['time_series_model'] = features.get('time_series_model', 'normal').lower()
+        if params['time_series_model'] not in ('normal', 'garch'):
+            raise ValueError("Invalid time_series_model for statistical simulation.")
     if 'portfolios' in features:
         params['portfolios'] = features['portfolios']
     else:
@@ -440,62 +638,21 @@ def build_simulation_params(features):
     return params
 
 def load_historical_data(assets):
-    # csv_path = os.path.join(os.path.dirname(__file__), 'stock_data_with_sector.csv')
-    csv_path = os.path.join(os.path.dirname(__file__), '..', 'stock_data_with_sector.csv')
-
-    df_wide = pd.read_csv(csv_path)
-    industry_row = df_wide.iloc[0]
-    ticker_row = df_wide.iloc[1]
-    date_row = df_wide.iloc[2]
-    data_part = df_wide.iloc[3:].copy()
-    data_part.rename(columns={'Price': 'Date'}, inplace=True)
-    data_part['Date'] = pd.to_datetime(data_part['Date'], errors='coerce')
-    
-    long_df = pd.melt(data_part, id_vars='Date', var_name='ColName', value_name='Value')
-    ticker_map = dict(zip(ticker_row.index, ticker_row.values))
-    industry_map = dict(zip(industry_row.index, industry_row.values))
-    long_df['Ticker'] = long_df['ColName'].map(ticker_map)
-    long_df['Industry'] = long_df['ColName'].map(industry_map)
-    
-    def get_attribute(c):
-        for attr in ['Close','Low','Open','Volume']:
-            if c.startswith(attr):
-                return attr
-        return None
-    long_df['Attribute'] = long_df['ColName'].apply(get_attribute)
-    
-    df_long = long_df.pivot_table(index=['Date','Ticker','Industry'],
-                                  columns='Attribute',
-                                  values='Value', aggfunc='first').reset_index()
-    df_long.sort_values(['Ticker','Date'], inplace=True)
-    close_df = df_long[['Date','Ticker','Close']].copy()
-    close_df.dropna(subset=['Close'], inplace=True)
-    close_df['Close'] = pd.to_numeric(close_df['Close'], errors='coerce')
-    close_df.dropna(subset=['Close'], inplace=True)
-    
-    pivot_df = close_df.pivot(index='Date', columns='Ticker', values='Close')
-    pivot_df.sort_index(inplace=True)
-    pivot_df = pivot_df.ffill().bfill()
-    monthly = pivot_df.resample('M').last()
-    monthly_returns = monthly.pct_change().dropna()
-    
+    # Monthly returns come from the process-wide market data store, so this
+    # no longer re-reads the CSV; each array is a view into the shared matrix.
+    store = market_data.get_store()
     asset_data = {}
     for asset in assets:
         ticker = asset['ticker']
-        if ticker not in monthly_returns.columns:
-            asset_data[ticker] = np.random.normal(0.07, 0.05, 120)
-        else:
-            arr = monthly_returns[ticker].dropna().values
-            if len(arr) < 12:
-                arr = np.random.normal(0.07, 0.05, 120)
-            asset_data[ticker] = arr
+        arr = store.returns_for(ticker)
+        if arr is None or len(arr) < 12:
+            # Placeholder series seeded by the ticker, so runs stay reproducible
+            # without touching numpy's global random state.
+            rng = np.random.default_rng(list(ticker.encode()))
+            arr = rng.normal(0.07, 0.05, max(store.returns.shape[1], 120))
+        asset_data[ticker] = arr
     return asset_data
 
-def compute_max_drawdown(path):
-    running_max = np.maximum.accumulate(path)
-    drawdowns = (running_max - path) / running_max
-    return np.max(drawdowns)
-
 def compute_performance_metrics(simulation_results, params):
     initial_amount = params['initial_amount']
     years = params['investment_years']
@@ -503,16 +660,18 @@ def compute_performance_metrics(simulation_results, params):
     mean_final = float(np.mean(final_values))
     median_final = float(np.median(final_values))
     std_final = float(np.std(final_values))
-    max_drawdowns = np.array([compute_max_drawdown(simulation_results[i, :]) 
-                              for i in range(simulation_results.shape[0])])
-    avg_max_drawdown = float(np.mean(max_drawdowns))
+    # Every per-path metric comes from one vectorized pass over the paths.
+    paths = simulation_summary.path_metrics(simulation_results, initial_amount, years)
+    avg_max_drawdown = float(np.mean(paths['max_drawdown']))
     var_5 = float(np.percentile(final_values, 5))
     cvar_5 = float(np.mean(final_values[final_values <= var_5]))
-    annual_returns = (final_values / initial_amount) ** (1 / years) - 1
+    annual_returns = paths['annual_return']
     avg_annual_return = float(np.mean(annual_returns))
     std_annual_return = float(np.std(annual_returns))
     risk_free_rate = params.get('base_interest_rate', 3.0) / 100.0
     sharpe_ratio = (avg_annual_return - risk_free_rate) / std_annual_return if std_annual_return != 0 else None
+    recovery_times = paths['recovery_time']
+    recovery_times = recovery_times[~np.isnan(recovery_times)]
     metrics = {
         'mean_final': mean_final,
         'median_final': median_final,
@@ -522,7 +681,10 @@ def compute_performance_metrics(simulation_results, params):
         'CVaR_5': cvar_5,
         'avg_annual_return': avg_annual_return,
         'std_annual_return': std_annual_return,
-        'sharpe_ratio': sharpe_ratio
+        'sharpe_ratio': sharpe_ratio,
+        'avg_time_under_water': float(np.mean(paths['time_under_water'])),
+        'avg_recovery_time': float(np.mean(recovery_times)) if len(recovery_times) else None,
+        'probability_of_ruin': float(np.mean(paths['ruined']))
     }
     return metrics
 
@@ -534,71 +696,230 @@ def make_results_summary(results, params):
         'std_dev': np.std(results, axis=0).tolist(),
         'performance_metrics': compute_performance_metrics(results, params)
     }
-    for p in percentiles:
-        summary['percentiles'][f'p{p}'] = np.percentile(results, p, axis=0).tolist()
+    # One partition per year for all percentiles, on year-major data.
+    values = np.percentile(np.ascontiguousarray(results.T), percentiles, axis=1)
+    for p, row in zip(percentiles, values):
+        summary['percentiles'][f'p{p}'] = row.tolist()
     return summary
 
+def simulation_cache_key(params, scenarios):
+    # None when the run is not reproducible (no seed) and must not be cached.
+    if params.get('random_seed') is None:
+        return None
+    payload = {
+        'version': SIMULATION_CACHE_VERSION,
+        'shard_paths': simulation_engine.SHARD_PATHS,
+        'params': params,
+        'scenarios': list(scenarios),
+        'data_version': (market_data.get_store().version
+                         if params['simulation_model'] == 'historical' else None),
+    }
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def parse_simulation_request(features):
+    # (simulation_params, scenarios) of a request body; ValueError if invalid.
+    if not features or 'simulation_model' not in features:
+        raise ValueError("Missing 'simulation_model' parameter.")
+    simulation_params = build_simulation_params(features)
+    if simulation_params['simulation_model'] not in SIMULATION_MODELS:
+        raise ValueError("Invalid simulation model specified.")
+    scenarios = features.get('scenarios', ['baseline', 'optimistic', 'pessimistic'])
+    return simulation_params, scenarios
+
+def simulate_request(params, scenario_params, asset_data=None, weights=None, progress=None):
+    # (summaries[s][p], convergence, memory plan) for a fixed or adaptive
+    # path count; convergence is None for a fixed num_simulations.
+    if weights is None:
+        weights = allocation_weights(params)
+    if params['convergence_tolerance'] > 0:
+        plan = adaptive_memory_plan(params, scenario_params, weights)
+        summaries, convergence = simulate_adaptive(params, scenario_params, asset_data, weights, progress, plan)
+        return summaries, convergence, plan
+    plan = request_memory_plan(params, scenario_params, weights)
+    return simulate_summaries(params, scenario_params, asset_data, weights, progress, plan), None, plan
+
+def memory_report(params, plan):
+    # Response block describing how the request's paths were stored. The
+    # peak is memory_plan's shape-based estimate, not measured usage.
+    return {
+        'precision': params.get('precision', 'float64'),
+        'memory_budget_mb': params.get('memory_budget_mb'),
+        'summary_mode': 'streaming' if plan['streaming'] else 'exact',
+        'shard_paths': plan['shard_paths'],
+        'concurrent_shards': plan['concurrent_shards'],
+        'estimated_peak_bytes': plan['estimated_peak_bytes'],
+        'estimate_method': 'array sizes from the request shape (not measured)',
+    }
+
+def run_simulation(simulation_params, scenarios, progress=None):
+    """Response body of a parsed simulator request, served from the result
+    cache when possible.
+
+    progress, if given, is called after every path shard (every batch with
+    an adaptive path count) with a dict of
+    paths_completed, total_paths and the final-balance partial_percentiles
+    of each scenario (per portfolio for multi-portfolio requests).
+    """
+    simulation_model = simulation_params['simulation_model']
+    results_by_scenario = {}
+
+    cache_key = simulation_cache_key(simulation_params, scenarios)
+    if cache_key is not None:
+        cached = simulation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    multi_portfolio = 'portfolios' in simulation_params
+    report = None
+    if progress is not None:
+        def report(paths_done, partial):
+            progress({
+                'paths_completed': int(paths_done),
+                'total_paths': (simulation_params['max_simulations']
+                                if simulation_params['convergence_tolerance'] > 0
+                                else simulation_params['num_simulations']),
+                'partial_percentiles': {
+                    scenario: ({f'portfolio_{i+1}': pct for i, pct in enumerate(scenario_partial)}
+                               if multi_portfolio else scenario_partial[0])
+                    for scenario, scenario_partial in zip(scenarios, partial)
+                }
+            })
+
+    if multi_portfolio:
+        # All portfolios share one asset list (the union of their tickers)
+        # and are simulated together against the same asset paths.
+        tickers, allocations = backtest_engine.build_weight_matrix(simulation_params['portfolios'])
+        base_params = dict(simulation_params, assets=[{
+            'ticker': ticker,
+            'mean_return': simulation_params.get('mu', 0.07),
+            'volatility': simulation_params.get('sigma', 0.15)
+        } for ticker in tickers])
+        asset_data = None
+        if simulation_model == 'historical' and tickers:
+            asset_data = load_historical_data(base_params['assets'])
+        # Each scenario adjusts the request's own parameters once.
+        scenario_params = [adjust_parameters_for_scenario(base_params, scenario) for scenario in scenarios]
+        summaries, convergence, plan = simulate_request(base_params, scenario_params, asset_data,
+                                                        weights=allocations / 100.0, progress=report)
+        for scenario, scenario_summaries in zip(scenarios, summaries):
+            results_by_scenario[scenario] = {'portfolioResults': {
+                f'portfolio_{i+1}': summary for i, summary in enumerate(scenario_summaries)
+            }}
+    else:
+        asset_data = None
+        if simulation_model == 'historical':
+            asset_data = load_historical_data(simulation_params['assets'])
+        # All scenarios are derived from one set of shocks.
+        scenario_params = [adjust_parameters_for_scenario(simulation_params, scenario)
+                           for scenario in scenarios]
+        summaries, convergence, plan = simulate_request(simulation_params, scenario_params, asset_data,
+                                                        progress=report)
+        results_by_scenario = {scenario: scenario_summaries[0]
+                               for scenario, scenario_summaries in zip(scenarios, summaries)}
+
+    final_output = {'scenarios': results_by_scenario, 'memory': memory_report(simulation_params, plan)}
+    if convergence is not None:
+        final_output['convergence'] = convergence
+    if cache_key is not None:
+        simulation_cache.put(cache_key, final_output)
+    return final_output
+
 # -------------------- Flask Route --------------------
 @simulator_bp.route('/simulator', methods=['POST'])
 def simulate():
     try:
-        features = request.get_json()
-        if not features or 'simulation_model' not in features:
-            return jsonify({"error": "Missing 'simulation_model' parameter."}), 400
-
-        simulation_params = build_simulation_params(features)
-        simulation_model = simulation_params['simulation_model']
-        scenarios = features.get('scenarios', ['baseline', 'optimistic', 'pessimistic'])
-        results_by_scenario = {}
-
-        if 'portfolios' in simulation_params:
-            for scenario in scenarios:
-                scenario_results = {}
-                params_adjusted = copy.deepcopy(simulation_params)
-                for i, portfolio in enumerate(params_adjusted['portfolios']):
-                    assets_list = []
-                    for ticker, allocation in portfolio['weights'].items():
-                        asset = {
-                            'ticker': ticker,
-                            'allocation': allocation,
-                            'mean_return': params_adjusted.get('mu', 0.07),
-                            'volatility': params_adjusted.get('sigma', 0.15)
-                        }
-                        assets_list.append(asset)
-                    params_adjusted['assets'] = assets_list
-                    params_adjusted = adjust_parameters_for_scenario(params_adjusted, scenario)
-                    if simulation_model == 'historical':
-                        asset_data = load_historical_data(assets_list)
-                        results = run_historical_simulation(params_adjusted, asset_data)
-                    elif simulation_model == 'parameterized':
-                        results = run_parameterized_simulation(params_adjusted)
-                    elif simulation_model == 'statistical':
-                        results = run_statistical_simulation(params_adjusted)
-                    else:
-                        return jsonify({"error": "Invalid simulation model specified."}), 400
-                    summary = make_results_summary(results, params_adjusted)
-                    scenario_results[f'portfolio_{i+1}'] = summary
-                results_by_scenario[scenario] = {'portfolioResults': scenario_results}
-        else:
-            asset_data = None
-            if simulation_model == 'historical':
-                asset_data = load_historical_data(simulation_params['assets'])
-            for scenario in scenarios:
-                params_adjusted = adjust_parameters_for_scenario(copy.deepcopy(simulation_params), scenario)
-                if simulation_model == 'historical':
-                    results = run_historical_simulation(params_adjusted, asset_data)
-                elif simulation_model == 'parameterized':
-                    results = run_parameterized_simulation(params_adjusted)
-                elif simulation_model == 'statistical':
-                    results = run_statistical_simulation(params_adjusted)
-                else:
-                    return jsonify({"error": "Invalid simulation model specified."}), 400
-                summary = make_results_summary(results, params_adjusted)
-                results_by_scenario[scenario] = summary
-
-        final_output = {'scenarios': results_by_scenario}
-        return jsonify(final_output)
-    
+        simulation_params, scenarios = parse_simulation_request(request.get_json())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return jsonify(run_simulation(simulation_params, scenarios))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
+
+@simulator_bp.route('/simulator/cache_stats', methods=['GET'])
+def simulator_cache_stats():
+    return jsonify(simulation_cache.stats())
+
+# -------------------- Simulation Jobs --------------------
+SSE_KEEPALIVE_SECONDS = 15
+
+def job_not_found():
+    return jsonify({"error": "Unknown simulation job."}), 404
+
+@simulator_bp.route('/simulator/jobs', methods=['POST'])
+def submit_simulation_job():
+    try:
+        simulation_params, scenarios = parse_simulation_request(request.get_json())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        job = simulation_jobs.submit(
+            lambda report: run_simulation(simulation_params, scenarios, progress=report))
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    return jsonify(dict(job.snapshot(),
+                        status_url=f'{request.base_url}/{job.id}',
+                        events_url=f'{request.base_url}/{job.id}/events',
+                        result_url=f'{request.base_url}/{job.id}/result')), 202
+
+@simulator_bp.route('/simulator/jobs/<job_id>', methods=['GET'])
+def simulation_job_status(job_id):
+    job = simulation_jobs.get(job_id)
+    if job is None:
+        return job_not_found()
+    return jsonify(job.snapshot())
+
+@simulator_bp.route('/simulator/jobs/<job_id>', methods=['DELETE'])
+def cancel_simulation_job(job_id):
+    job = simulation_jobs.cancel(job_id)
+    if job is None:
+        return job_not_found()
+    return jsonify(job.snapshot())
+
+@simulator_bp.route('/simulator/jobs/<job_id>/result', methods=['GET'])
+def simulation_job_result(job_id):
+    job = simulation_jobs.get(job_id)
+    if job is None:
+        return job_not_found()
+    if job.status == 'done':
+        return jsonify(job.result)
+    if job.status == 'failed':
+        # Invalid input only found while running (ValueError) is the
+        # client's error, as on the synchronous route.
+        return jsonify({"error": job.error}), 400 if job.client_error else 500
+    if job.status == 'cancelled':
+        return jsonify({"error": "Simulation job was cancelled."}), 409
+    return jsonify(job.snapshot()), 202
+
+@simulator_bp.route('/simulator/jobs/<job_id>/events', methods=['GET'])
+def simulation_job_events(job_id):
+    # Server-sent events: a 'progress' event whenever the job changes, then
+    # one final event named after its end state.
+    job = simulation_jobs.get(job_id)
+    if job is None:
+        return job_not_found()
+
+    def events():
+        version = -1
+        while True:
+            latest = job.wait_for_update(version, SSE_KEEPALIVE_SECONDS)
+            if latest == version:
+                yield ': keepalive\n\n'
+                continue
+            version = latest
+            snapshot = job.snapshot()
+            event = snapshot['status'] if job.done else 'progress'
+            yield f'event: {event}\ndata: {json.dumps(snapshot)}\n\n'
+            if job.done:
+                return
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@simulator_bp.route('/simulator/jobs/stats', methods=['GET'])
+def simulation_job_stats():
+    return jsonify(simulation_jobs.stats())
@@ -0,0 +1,66 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blueprints.backtest_engine import run_backtest, compute_backtest_metrics  # noqa: E402
+
+# period_length for each rebalancing option of /multi_portfolio_backtest.
+REBALANCING = {'none': None, 'monthly': 1, 'quarterly': 3, 'semiannually': 6, 'annually': 12}
+
+WEIGHTS = np.array([
+    [0.0, 0.0, 0.0],
+    [0.3, 0.3, 0.0],
+    [0.5, 0.2, 0.3],
+    [0.0, 0.0, 0.4],
+])
+
+
+def asset_returns(seed, n_months=61):
+    return np.random.default_rng(seed).normal(0.008, 0.05, (n_months, 3))
+
+
+def reference_backtest(returns, weights, initial_capital, withdrawal_amount, period_length):
+    # Month by month: each asset and the cash remainder drift on their own
+    # and are reset to target (after the withdrawal) every period_length months.
+    targets = np.append(weights, 1.0 - weights.sum())
+    holdings = initial_capital * targets
+    balances = []
+    for t, r in enumerate(returns):
+        holdings = holdings * (1.0 + np.append(r, 0.0))
+        balance = holdings.sum()
+        if period_length and (t + 1) % period_length == 0:
+            balance = max(balance - withdrawal_amount, 0.0)
+            holdings = balance * targets
+        balances.append(balance)
+    return np.array(balances)
+
+
+@pytest.mark.parametrize('rebalancing', REBALANCING)
+@pytest.mark.parametrize('withdrawal_amount', [0, 150])
+@pytest.mark.parametrize('seed', range(3))
+def test_partial_weights_hold_the_remainder_as_cash(rebalancing, withdrawal_amount, seed):
+    returns = asset_returns(seed)
+    period_length = REBALANCING[rebalancing]
+    portfolio_returns, balances = run_backtest(returns, WEIGHTS, 10000, withdrawal_amount, period_length)
+
+    assert np.all(np.isfinite(portfolio_returns))
+    for p, weights in enumerate(WEIGHTS):
+        expected = reference_backtest(returns, weights, 10000, withdrawal_amount, period_length)
+        assert np.allclose(balances[:, p], expected)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_zero_weight_portfolio_is_the_same_under_every_rebalancing(seed):
+    returns = asset_returns(seed)
+    for period_length in REBALANCING.values():
+        portfolio_returns, balances = run_backtest(returns, WEIGHTS[:1], 10000, 0, period_length)
+        metrics = compute_backtest_metrics(portfolio_returns, balances, 10000)
+        assert np.all(portfolio_returns == 0.0)
+        assert np.all(balances == 10000)
+        assert metrics['final_balance'][0] == 10000
+        assert metrics['CAGR'][0] == 0.0
+        assert metrics['max_drawdown'][0] == 0.0
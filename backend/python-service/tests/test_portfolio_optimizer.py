@@ -0,0 +1,51 @@
+import os
+import sys
+import warnings
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blueprints.portfolio_optimizer import critical_line, interpolate_frontier, solve_long_only_qp  # noqa: E402
+
+
+def rank_deficient_problem(rng, kind):
+    n = 12
+    if kind == 'short_history':
+        # Fewer monthly observations than assets.
+        returns = rng.normal(0.01, 0.05, (8, n))
+    else:
+        # The same ticker requested twice.
+        returns = rng.normal(0.01, 0.05, (120, n))
+        returns[:, 5] = returns[:, 0]
+    return returns.mean(axis=0) * 12, np.cov(returns, rowvar=False) * 12
+
+
+@pytest.mark.parametrize('kind', ['duplicate_ticker', 'short_history'])
+@pytest.mark.parametrize('seed', range(5))
+def test_critical_line_with_rank_deficient_covariance(kind, seed):
+    mu, cov = rank_deficient_problem(np.random.default_rng(seed), kind)
+    assert np.linalg.matrix_rank(cov) < len(mu)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        turning_points = critical_line(mu, cov)
+
+    assert np.all(np.isfinite(turning_points))
+    assert np.allclose(turning_points.sum(axis=1), 1.0)
+    assert np.all(turning_points >= 0.0)
+
+    floor = 1e-9 * np.trace(cov) / len(mu)
+    gmv, _ = solve_long_only_qp(cov)
+    gmv_var = gmv @ cov @ gmv
+    end = turning_points[-1]
+    assert end @ cov @ end <= gmv_var + 1e-6 * max(gmv_var, floor)
+
+    # Every frontier portfolio is as good as the QP optimum at its return.
+    scale = np.diag(cov).max() / np.ptp(mu)
+    for lam in scale * np.geomspace(1e-3, 1e2, 10):
+        w, _ = solve_long_only_qp(cov, c=-lam * mu)
+        on_frontier = interpolate_frontier(turning_points, mu, [w @ mu])[0]
+        qp_var = w @ cov @ w
+        assert on_frontier @ cov @ on_frontier <= qp_var + 1e-4 * max(qp_var, floor)
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blueprints import simulator  # noqa: E402
+
+ASSETS = [
+    {'ticker': 'EQ', 'allocation': 60, 'mean_return': 0.07, 'volatility': 0.16},
+    {'ticker': 'BD', 'allocation': 40, 'mean_return': 0.03, 'volatility': 0.06},
+]
+
+
+def adaptive_request(**features):
+    params = simulator.build_simulation_params(dict({
+        'simulation_model': 'statistical',
+        'assets': ASSETS,
+        'investment_years': 30,
+        'random_seed': 3,
+    }, **features))
+    _, convergence, _ = simulator.simulate_request(params, [params])
+    return params, convergence
+
+
+@pytest.mark.parametrize('withdrawal_amount', [500, 900])
+def test_withdrawal_scenario_converges_below_the_budget(withdrawal_amount):
+    # Many paths deplete here, so some reported percentiles are zero.
+    params, convergence = adaptive_request(cashflow_type='withdraw_fixed', withdrawal_amount=withdrawal_amount,
+                                           convergence_tolerance=0.05)
+    assert convergence['converged']
+    assert convergence['precision'] <= 0.05
+    assert convergence['paths_used'] < params['max_simulations']
+
+
+def test_withdrawal_precision_shrinks_with_the_tolerance():
+    kwargs = {'cashflow_type': 'withdraw_fixed', 'withdrawal_amount': 500}
+    _, loose = adaptive_request(convergence_tolerance=0.05, **kwargs)
+    _, tight = adaptive_request(convergence_tolerance=0.02, **kwargs)
+    assert tight['converged']
+    assert tight['precision'] < loose['precision']
+    assert tight['paths_used'] > loose['paths_used']
@@ -0,0 +1,70 @@
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blueprints import simulation_summary, simulator  # noqa: E402
+
+ASSETS = [
+    {'ticker': 'EQ', 'allocation': 60, 'mean_return': 0.08, 'volatility': 0.18},
+    {'ticker': 'BD', 'allocation': 40, 'mean_return': 0.04, 'volatility': 0.06},
+]
+
+
+def traced_request(**features):
+    params = simulator.build_simulation_params(dict({
+        'simulation_model': 'parameterized',
+        'assets': ASSETS,
+        'num_simulations': 20000,
+        'investment_years': 30,
+        'rebalancing_frequency': 'monthly',
+        'random_seed': 1,
+    }, **features))
+    tracemalloc.start()
+    try:
+        _, _, plan = simulator.simulate_request(params, [params])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return plan, peak
+
+
+@pytest.mark.parametrize('features', [
+    {'memory_budget_mb': 4},
+    {'memory_budget_mb': 4, 'precision': 'float32'},
+    {'memory_budget_mb': 2, 'summary_mode': 'streaming'},
+    {'memory_budget_mb': 32, 'summary_mode': 'exact'},
+    {'memory_budget_mb': 4, 'convergence_tolerance': 0.01},
+])
+def test_measured_peak_stays_within_budget(features):
+    plan, peak = traced_request(**features)
+    assert peak <= features['memory_budget_mb'] * 1024 * 1024
+    assert plan['estimated_peak_bytes'] <= features['memory_budget_mb'] * 1024 * 1024
+
+
+@pytest.mark.parametrize('summary_mode', ['exact', 'streaming'])
+@pytest.mark.parametrize('precision', ['float64', 'float32'])
+def test_estimate_bounds_measured_peak(precision, summary_mode):
+    plan, peak = traced_request(precision=precision, summary_mode=summary_mode)
+    assert peak <= plan['estimated_peak_bytes']
+
+
+def test_streaming_summary_keeps_float32_chunks():
+    paths = 10000 * np.exp(np.cumsum(np.random.default_rng(0).normal(0.05, 0.15, (20000, 30)), axis=1))
+    peaks = {}
+    for dtype in (np.float64, np.float32):
+        chunk = paths.astype(dtype)
+        summary = simulation_summary.StreamingSummary(30, 10000)
+        tracemalloc.start()
+        try:
+            summary.update(chunk)
+            _, peaks[dtype] = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    # Without a float64 copy, a float32 chunk's temporaries are about half
+    # the size of a float64 chunk's.
+    assert peaks[np.float32] < 0.75 * peaks[np.float64]